@@ -6,14 +6,32 @@ import queue
 import ssl
 import hashlib
 import base64
+import binascii
 import hmac
+import os
+import unicodedata
+import wave
+import math
+import zlib
+import itertools
+from collections import OrderedDict, deque, namedtuple
+from functools import lru_cache
+from concurrent.futures import Future
 from urllib.parse import urlencode
+from wsgiref.handlers import format_date_time
 from datetime import datetime
 from time import mktime
-import _thread as thread
+import numpy as np
 import pyaudio
 import websocket
-from typing import List, Dict, Any
+import httpx
+import openai
+from typing import List, Dict, Any, Optional
+
+try:
+    from pypinyin import lazy_pinyin
+except ImportError:  # 未安装 pypinyin 时使用内置的常用字拼音表
+    lazy_pinyin = None
 
 # --- 1. 导入 LangChain 核心组件 ---
 from langchain_community.chat_models import ChatOpenAI
@@ -21,18 +39,122 @@ from langchain.agents import AgentExecutor, create_openai_tools_agent
 from langchain_core.tools import tool
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.documents import Document
-from langchain_community.vectorstores import InMemoryVectorStore
-from langchain_community.embeddings import FakeEmbeddings # 使用假嵌入进行演示
+from langchain_core.embeddings import Embeddings
 from langchain_core.retrievers import BaseRetriever
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.agents import AgentFinish
 
 # =======================================================
 # ========== 硬件模拟与 LangChain Tools (与上一版本相同) ==========
 # =======================================================
 
+# 每个舵机的限速 (度/秒) 和加速度上限 (度/秒²)，舵机 6 为夹爪
+SERVO_LIMITS = [(180.0, 2000.0)] * 5 + [(240.0, 3000.0)]
+MIN_MOVE_MS = 20
+
+def move_duration_ms(start: List[float], target: List[float], limits: List = SERVO_LIMITS) -> int:
+    """按梯形速度曲线计算从 start 到 target 所需的最短时长 (毫秒)，取各关节中最慢的一个"""
+    slowest = 0.0
+    for a, b, (v_max, acc) in zip(start, target, limits):
+        delta = abs(b - a)
+        if delta <= v_max * v_max / acc:
+            t = 2.0 * math.sqrt(delta / acc)  # 三角形曲线：达不到限速就要减速
+        else:
+            t = delta / v_max + v_max / acc
+        slowest = max(slowest, t)
+    return max(MIN_MOVE_MS, int(math.ceil(slowest * 1000)))
+
+class MotionInterrupted(Exception):
+    """运动等待被急停打断"""
+
+class ServoTrack:
+    """单个舵机在虚拟时钟上的运动：在 [t_start, t_end] 毫秒内从 start 匀速转到 target (t_start 之前不动)"""
+    __slots__ = ("start", "target", "t_start", "t_end")
+
+    def __init__(self, angle: float):
+        self.start = self.target = angle
+        self.t_start = self.t_end = 0.0
+
+    def angle_at(self, t: float) -> float:
+        if t >= self.t_end:
+            return self.target
+        if t <= self.t_start:
+            return self.start
+        frac = (t - self.t_start) / (self.t_end - self.t_start)
+        return self.start + (self.target - self.start) * frac
+
+class ServoStateCache:
+    """舵机状态缓存：记录每个舵机已知的角度 (None 表示未知)，用于过滤无效写入。
+
+    写入后记为目标角度；闭环检测未到位 (堵转 / 超时) 时改为回读到的角度，
+    reconcile() 按需回读全部舵机与缓存对账。enabled=False 时只计数、不过滤。
+    """
+    def __init__(self, servo_count: int = 6, tolerance: float = 1.0, enabled: bool = True):
+        self.angles: List[Any] = [None] * servo_count
+        self.tolerance = tolerance
+        self.enabled = enabled
+        self.counters = {"writes": 0, "writes_skipped": 0, "wait_ms_saved": 0, "reconciles": 0, "corrections": 0}
+
+    def is_at(self, targets: Dict[int, float]) -> bool:
+        """targets ({舵机号: 角度}) 中的舵机是否都已确定在目标角度上"""
+        if not self.enabled:
+            return False
+        for servo_id, angle in targets.items():
+            known = self.angles[servo_id - 1]
+            if known is None or abs(known - angle) > self.tolerance:
+                return False
+        return True
+
+    def update(self, targets: Dict[int, float]):
+        """记录一次串口写入"""
+        self.counters["writes"] += 1
+        for servo_id, angle in targets.items():
+            self.angles[servo_id - 1] = angle
+
+    def observe(self, servo_id: int, angle):
+        self.angles[servo_id - 1] = angle
+
+    def skip(self, wait_ms: float):
+        """记录一次被过滤的无效写入及省下的等待时间"""
+        self.counters["writes_skipped"] += 1
+        self.counters["wait_ms_saved"] += wait_ms
+
+    def reconcile(self, read_fn) -> List[int]:
+        """用 read_fn(舵机号) 回读全部舵机校准缓存，返回与缓存不一致的舵机号"""
+        self.counters["reconciles"] += 1
+        corrected = []
+        for servo_id in range(1, len(self.angles) + 1):
+            angle = read_fn(servo_id)
+            known = self.angles[servo_id - 1]
+            if angle is None or known is None or abs(known - angle) > self.tolerance:
+                corrected.append(servo_id)
+            self.angles[servo_id - 1] = angle
+        self.counters["corrections"] += len(corrected)
+        return corrected
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, angles=list(self.angles))
+
 class ArmDeviceSimulator:
-    """模拟 Arm_Lib 机械臂设备"""
-    def __init__(self):
-        print("🛠️ ArmDeviceSimulator: 机械臂硬件模拟初始化。")
+    """模拟 Arm_Lib 机械臂设备 (离散事件模型)。
+
+    舵机状态挂在虚拟时钟 now_ms 上：每次写入从当前实际角度起算，到位时刻取
+    s_time 与舵机物理限速 (servo_limits) 所需时长中的较大者；wait() 只推进
+    虚拟时钟，因此上千个分拣周期只需几秒真实时间。time_scale > 0 时等待
+    按比例真实 sleep (1.0 为实时)，用于还原硬件上的阻塞。
+
+    Arm_serial_servo_read 按当前虚拟时刻回读角度 (取整，每次回读耗时 read_ms)；
+    grip_contact 为夹爪合拢时碰到物体的角度 (None 表示没有物体)，夹爪会堵转在该角度；
+    dead_ms 为命令下发到舵机开始转动的死区时间。
+    设置 detector (CompletionDetector) 后，运动按回读闭环确认到位，否则按固定时长等待。
+    arm_move / arm_move_up / arm_clamp_block 通过 cache (ServoStateCache) 跳过
+    目标与已知角度相同的写入和等待。
+    """
+    def __init__(self, write_latency: float = 0.0, servo_limits: List = SERVO_LIMITS, time_scale: float = 0.0,
+                 verbose: bool = True, grip_contact: float = None, read_ms: float = 0.0, servo_cache: bool = True,
+                 dead_ms: float = 0.0):
+        self.verbose = verbose
+        self._log("🛠️ ArmDeviceSimulator: 机械臂硬件模拟初始化。")
         self.positions = {
             "初始位置": [90, 130, 0, 0, 90],
             "准备位置": [90, 80, 50, 50, 270],
@@ -42,86 +164,668 @@ class ArmDeviceSimulator:
             "放置绿色": [136, 66, 20, 29, 270],
             "放置蓝色": [44, 66, 20, 28, 270],
         }
+        # 6 个舵机最后一次写入的目标角度 (舵机 6 为夹爪)；实际角度见 current_angles()
+        self.servo_angles = [90, 90, 90, 90, 90, 90]
+        self.servos = [ServoTrack(a) for a in self.servo_angles]
+        self.servo_limits = servo_limits
+        # 每条串口命令的模拟总线耗时 (秒)，用于评估写入方式的开销
+        self.write_latency = write_latency
+        # 虚拟时钟 (毫秒)：累计的等待舵机运动的时间，即真实硬件上会阻塞的时长
+        self.now_ms = 0.0
+        self.time_scale = time_scale
+        # 急停标志：置位后正在进行和之后的等待都会立即抛出 MotionInterrupted
+        self.halt = threading.Event()
+        self.grip_contact = grip_contact
+        self.read_ms = read_ms
+        self.dead_ms = dead_ms
+        self.detector = None
+        self.cache = ServoStateCache(enabled=servo_cache)
+        # late_moves: 给定的 s_time 短于舵机物理上所需时长的写入次数
+        self.sim_stats = {"writes": 0, "reads": 0, "late_moves": 0}
         self.current_action = "init"
         self.init_arm()
 
+    def _log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def _command(self, index: int, angle: float, s_time: int):
+        """在当前虚拟时刻给一个舵机下发新目标，计算其到位时刻"""
+        track = self.servos[index]
+        start = track.angle_at(self.now_ms)
+        duration = 0.0
+        if start != angle:
+            physical = move_duration_ms([start], [angle], [self.servo_limits[index]])
+            if physical > s_time:
+                self.sim_stats["late_moves"] += 1
+            duration = max(s_time, physical)
+        self.servo_angles[index] = angle
+        if index == 5 and self.grip_contact is not None and start < self.grip_contact < angle:
+            # 夹爪合拢途中碰到物体，停在接触角度
+            duration *= (self.grip_contact - start) / (angle - start)
+            angle = self.grip_contact
+        track.start, track.target = start, angle
+        delay = self.dead_ms if duration else 0.0
+        track.t_start, track.t_end = self.now_ms + delay, self.now_ms + delay + duration
+
     def Arm_serial_servo_write(self, servo_id, angle, s_time):
-        print(f"  [ARM_MOVE_SIM] 舵机 {servo_id} 移动到 {angle} (耗时: {s_time/1000}s)")
+        self._log(f"  [ARM_MOVE_SIM] 舵机 {servo_id} 移动到 {angle} (耗时: {s_time/1000}s)")
+        self._command(servo_id - 1, angle, s_time)
+        self.cache.update({servo_id: angle})
+        self.sim_stats["writes"] += 1
+        if self.write_latency:
+            time.sleep(self.write_latency)
+
+    def Arm_serial_servo_write6(self, s1, s2, s3, s4, s5, s6, s_time):
+        """模拟 Arm_Lib 的六舵机同步写入：一帧命令同时下发全部关节，各关节同时起动"""
+        self._log(f"  [ARM_MOVE_SIM] 同步写入舵机 1-6: {[s1, s2, s3, s4, s5, s6]} (耗时: {s_time/1000}s)")
+        angles = (s1, s2, s3, s4, s5, s6)
+        for index, angle in enumerate(angles):
+            self._command(index, angle, s_time)
+        self.cache.update({index + 1: angle for index, angle in enumerate(angles)})
+        self.sim_stats["writes"] += 1
+        if self.write_latency:
+            time.sleep(self.write_latency)
+
+    def Arm_serial_servo_read(self, servo_id):
+        """模拟 Arm_Lib 的舵机角度回读"""
+        self.now_ms += self.read_ms
+        self.sim_stats["reads"] += 1
+        return int(round(self.servos[servo_id - 1].angle_at(self.now_ms)))
+
+    def current_angles(self) -> List[float]:
+        """各舵机在当前虚拟时刻的实际角度"""
+        return [track.angle_at(self.now_ms) for track in self.servos]
+
+    def motion_done_at(self) -> float:
+        """所有舵机到位的虚拟时刻 (毫秒)"""
+        return max(track.t_end for track in self.servos)
+
+    def settle(self):
+        """虚拟时钟直接跳到所有舵机到位的时刻"""
+        self.now_ms = max(self.now_ms, self.motion_done_at())
+
+    def wait(self, ms: int):
+        """等待舵机运动 (推进虚拟时钟)；急停时抛出 MotionInterrupted，时钟只推进到被打断的时刻"""
+        if self.halt.is_set():
+            raise MotionInterrupted()
+        if not self.time_scale:
+            self.now_ms += ms
+            return
+        t0 = time.monotonic()
+        interrupted = self.halt.wait(ms / 1000 * self.time_scale)
+        if interrupted:
+            self.now_ms += min(ms, (time.monotonic() - t0) * 1000 / self.time_scale)
+            raise MotionInterrupted()
+        self.now_ms += ms
+
+    def arm_hold(self):
+        """急停：把全部舵机的目标改写为当前实际角度，使其停在原地"""
+        angles = [round(a) for a in self.current_angles()]
+        self._log(f"  [ARM_HOLD_SIM] 保持当前姿态: {angles}")
+        self.Arm_serial_servo_write6(*angles, MIN_MOVE_MS)
 
     def arm_clamp_block(self, enable: int):
         action = "夹紧夹爪" if enable == 1 else "松开夹爪"
-        print(f"  [ARM_CLAMP_SIM] {action}")
-        self.Arm_serial_servo_write(6, 130 if enable == 1 else 60, 400)
+        self._log(f"  [ARM_CLAMP_SIM] {action}")
+        angle = 130 if enable == 1 else 60
+        if self.cache.is_at({6: angle}):
+            self._skip_noop(500, 1)
+            return
+        self.Arm_serial_servo_write(6, angle, 400)
+        if self.detector is not None:
+            self.detector.wait({6: angle}, 400)
+        else:
+            self.wait(500)
 
-    def arm_move(self, position: List[int], s_time: int = 500):
-        print(f"  [ARM_MOVE_SIM] 移动到位置: {position} (耗时: {s_time/1000}s)")
-        for i, angle in enumerate(position):
-            servo_id = i + 1
-            self.Arm_serial_servo_write(servo_id, angle, s_time)
+    def move_duration(self, target: List[float], start: List[float] = None) -> int:
+        """从 start (默认当前角度) 运动到 target 的最短安全时长 (毫秒)"""
+        start = self.servo_angles if start is None else start
+        return move_duration_ms(start, target, self.servo_limits)
 
-    def arm_move_up(self):
-        print("  [ARM_MOVE_SIM] 机械臂向上抬升...")
-        self.Arm_serial_servo_write(2, 90, 1500)
-        self.Arm_serial_servo_write(3, 90, 1500)
-        self.Arm_serial_servo_write(4, 90, 1500)
+    def arm_move(self, position: List[int], s_time: int = None):
+        """5 个关节一帧同步写入，夹爪保持当前角度；未指定 s_time 时按关节角变化计算"""
+        if s_time is None:
+            s_time = self.move_duration(list(position[:5]) + [self.servo_angles[5]])
+        if self.cache.is_at({i + 1: position[i] for i in range(5)}):
+            self._skip_noop(s_time, 5)
+            return
+        self._log(f"  [ARM_MOVE_SIM] 移动到位置: {position} (耗时: {s_time/1000}s)")
+        self.Arm_serial_servo_write6(*position[:5], self.servo_angles[5], s_time)
+        self._wait_joints(position, s_time)
+
+    def arm_move_up(self, s_time: int = None):
+        self._log("  [ARM_MOVE_SIM] 机械臂向上抬升...")
+        target = list(self.servo_angles)
+        target[1:4] = [90, 90, 90]
+        if s_time is None:
+            s_time = self.move_duration(target)
+        if self.cache.is_at({2: 90, 3: 90, 4: 90}):
+            self._skip_noop(s_time, 5)
+            return
+        self.Arm_serial_servo_write6(*target, s_time)
+        self._wait_joints(target, s_time)
+
+    def _skip_noop(self, wait_ms: int, servo_count: int):
+        """跳过无效写入：固定等待省下 wait_ms，闭环等待省下一轮回读"""
+        self.cache.skip(wait_ms if self.detector is None else servo_count * self.read_ms)
+
+    def _wait_joints(self, position: List[int], s_time: int):
+        if self.detector is not None:
+            self.detector.wait({i + 1: position[i] for i in range(5)}, s_time)
+        else:
+            self.wait(s_time)
+
+    def reconcile(self) -> List[int]:
+        """回读全部舵机，与状态缓存对账，返回缓存有误的舵机号"""
+        corrected = self.cache.reconcile(self.Arm_serial_servo_read)
+        for servo_id in corrected:
+            angle = self.cache.angles[servo_id - 1]
+            if angle is not None:
+                self.servo_angles[servo_id - 1] = angle  # 之后的轨迹从实际角度起算
+        return corrected
 
     def init_arm(self):
-        print("  [SYSTEM] 正在初始化机械臂...")
+        self._log("  [SYSTEM] 正在初始化机械臂...")
         self.arm_clamp_block(0)
-        self.arm_move(self.positions["初始位置"], 1000)
+        self.arm_move(self.positions["初始位置"])
         self.current_action = "init"
-        print("  [SYSTEM] 机械臂初始化完成")
+        self._log("  [SYSTEM] 机械臂初始化完成")
+
+class CompletionDetector:
+    """舵机回读闭环到位检测 (轮询 Arm_serial_servo_read)。
+
+    每 poll_ms 回读一次目标舵机：全部进入 tolerance 即判定到位 ("arrived")；
+    只剩夹爪未到位、且夹爪连续 stall_ms 没有转动时判定堵转 ("stalled"，夹住了物体)；
+    超过 s_time * timeout_factor + timeout_margin_ms 仍未到位则超时 ("timeout")。
+    堵转判断要等舵机已被观察到转动、或下发后超过 start_grace_ms 才开始，避免把
+    命令到起动之间的死区误判为堵转；关节 (舵机 1-5) 不转只会等到超时，不会当作到位。
+    """
+    def __init__(self, arm, poll_ms: int = 20, tolerance: float = 3.0, stall_ms: int = 60,
+                 stall_delta: float = 1.0, timeout_factor: float = 1.5, timeout_margin_ms: int = 200,
+                 start_grace_ms: int = 200):
+        self.arm = arm
+        self.start_grace_ms = start_grace_ms
+        self.poll_ms = poll_ms
+        self.tolerance = tolerance
+        self.stall_ms = stall_ms
+        self.stall_delta = stall_delta
+        self.timeout_factor = timeout_factor
+        self.timeout_margin_ms = timeout_margin_ms
+        self.counters = {"arrived": 0, "stalled": 0, "timeout": 0, "polls": 0}
+
+    def _sleep(self, ms: int):
+        if hasattr(self.arm, "wait"):
+            self.arm.wait(ms)  # 模拟器推进虚拟时钟，急停时会被打断
+        else:
+            time.sleep(ms / 1000)
+
+    def wait(self, targets: Dict[int, float], s_time: int) -> str:
+        """targets 为 {舵机号: 目标角度}，返回 "arrived" / "stalled" / "timeout" """
+        deadline = s_time * self.timeout_factor + self.timeout_margin_ms
+        # 只有预计在 stall_ms 内明显转动的舵机才做堵转判断，慢速小幅运动只靠超时兜底
+        min_rate = 3 * self.stall_delta / self.stall_ms
+        first = {}
+        last = {}
+        anchor = {}  # 各舵机本轮静止窗口起点的角度
+        still_ms = {}
+        moved = set()  # 已观察到开始转动的舵机
+        elapsed = 0
+        while True:
+            self.counters["polls"] += 1
+            pending = []
+            for servo_id, target in targets.items():
+                angle = self.arm.Arm_serial_servo_read(servo_id)
+                if angle is None:  # 回读失败，本轮视为未到位
+                    pending.append(servo_id)
+                    continue
+                first.setdefault(servo_id, angle)
+                if abs(angle - first[servo_id]) > self.stall_delta:
+                    moved.add(servo_id)
+                if abs(angle - target) > self.tolerance:
+                    pending.append(servo_id)
+                    if servo_id not in anchor or abs(angle - anchor[servo_id]) > self.stall_delta:
+                        anchor[servo_id] = angle
+                        still_ms[servo_id] = 0
+                    else:
+                        still_ms[servo_id] += self.poll_ms
+                last[servo_id] = angle
+            if not pending:
+                status = "arrived"
+                break
+            # 只有夹爪堵转 (夹住物体) 视为完成；关节不转可能是尚未起动，继续等到超时
+            if (pending == [6] and 6 in first and (6 in moved or elapsed >= self.start_grace_ms)
+                    and still_ms.get(6, 0) >= self.stall_ms and abs(targets[6] - first[6]) / max(1, s_time) >= min_rate):
+                status = "stalled"
+                break
+            if elapsed >= deadline:
+                status = "timeout"
+                print(f"⚠️ 舵机 {pending} 等待到位超时 ({deadline:.0f}ms)")
+                break
+            self._sleep(self.poll_ms)
+            elapsed += self.poll_ms
+        self.counters[status] += 1
+        cache = getattr(self.arm, "cache", None)
+        if cache is not None and status != "arrived":
+            for servo_id in pending:
+                cache.observe(servo_id, last.get(servo_id))  # 没到目标，缓存改为实际回读值
+        return status
 
 ARM_DEVICE = ArmDeviceSimulator()
+ARM_DEVICE.detector = CompletionDetector(ARM_DEVICE)
+
+# =======================================================
+# ========== 运动编译 (组合动作轨迹优化) ==========
+# =======================================================
+
+# 航点: kind 为 "move" 时 target 是 5 个关节角 (None 表示保持当前角度)，
+# kind 为 "grip" 时 target 是夹爪角度。overlap=True 的航点可以与下一个
+# 舵机集合不相交的航点同时执行 (见 MotionCompiler._schedule)
+Waypoint = namedtuple("Waypoint", ["kind", "target", "overlap"], defaults=[False])
+# 编译后的轨迹段: 6 个舵机的目标角、运动时长、下发后等待多久再下发下一段 (毫秒)
+Segment = namedtuple("Segment", ["angles", "s_time", "wait_ms"])
+
+def move_to(position: List[int]) -> Waypoint:
+    return Waypoint("move", list(position))
+
+def move_up() -> Waypoint:
+    """与 arm_move_up 相同：关节 2-4 抬到 90 度，其余保持"""
+    return Waypoint("move", [None, 90, 90, 90, None])
+
+def grip(enable: int, overlap: bool = False) -> Waypoint:
+    """overlap 只应用于不依赖关节到位、也不会丢下物体的夹爪动作，例如空夹爪在归位途中合拢"""
+    return Waypoint("grip", 130 if enable == 1 else 60, overlap)
+
+def sort_waypoints(place_position: List[int], arm=None) -> List[Waypoint]:
+    """分拣流程的航点：准备 -> 抓取 -> 夹紧 -> 抬升 -> 放置 -> 松开 -> 抬升"""
+    arm = arm or ARM_DEVICE
+    return [
+        move_to(arm.positions["准备位置"]),
+        move_to(arm.positions["抓取位置"]),
+        grip(1),
+        move_up(),
+        move_to(place_position),
+        grip(0),
+        move_up(),
+    ]
+
+class MotionCompiler:
+    """把工具的航点序列编译成一条优化后的轨迹。
+
+    - 与上一位姿几乎重合、或落在前后航点连线上的途经点被合并掉；
+    - 相邻两段运动之间没有夹爪动作时，中间位姿作为途经点：前一段完成
+      (1 - blend) 后就下发下一段，舵机直接转向新目标而不是停下来；
+    - 每段时长由 duration_fn(target, start) 按关节角变化计算 (默认使用
+      SERVO_LIMITS 的限速和加速度)，不再固定 1000ms。
+    - 标记 overlap 的航点与下一个航点的舵机集合不相交时合并为一段，一帧同时
+      下发 (例如在转向目标的同时张开夹爪)；舵机集合相交的航点保持先后顺序。
+    抓取位、放置位等夹爪动作前后的位姿都是停止点，必须完整到位。
+    """
+    def __init__(self, duration_fn=None, merge_tolerance: float = 2.0,
+                 blend: float = 0.35, grip_time_ms: int = 400, grip_dwell_ms: int = 500):
+        self.duration_fn = duration_fn or (lambda target, start: move_duration_ms(start, target))
+        self.merge_tolerance = merge_tolerance
+        self.blend = blend
+        self.grip_time_ms = grip_time_ms
+        self.grip_dwell_ms = grip_dwell_ms
+
+    def _on_line(self, a: List[float], b: List[float], c: List[float]) -> bool:
+        """b 是否 (在容差内) 落在 a -> c 的关节空间直线上"""
+        direction = [y - x for x, y in zip(a, c)]
+        norm = sum(d * d for d in direction)
+        if norm == 0:
+            return False
+        t = sum((y - x) * d for x, y, d in zip(a, b, direction)) / norm
+        if not 0.0 <= t <= 1.0:
+            return False
+        return all(abs(x + t * d - y) <= self.merge_tolerance for x, y, d in zip(a, b, direction))
+
+    def _schedule(self, waypoints: List[Waypoint]) -> List:
+        """资源调度：把航点展开成 6 轴目标 (None 为不动)，overlap 航点与下一个
+        舵机集合不相交的航点合并，返回 [(kind, 6 轴目标), ...]"""
+        scheduled = []
+        for wp in waypoints:
+            full = [None] * 5 + [wp.target] if wp.kind == "grip" else list(wp.target) + [None] * (6 - len(wp.target))
+            if scheduled:
+                prev_kind, prev_full, prev_overlap = scheduled[-1]
+                disjoint = all(a is None or b is None for a, b in zip(prev_full, full))
+                if disjoint and prev_overlap:
+                    fused = [b if a is None else a for a, b in zip(prev_full, full)]
+                    kind = "move" if any(a is not None for a in fused[:5]) else "grip"
+                    scheduled[-1] = (kind, fused, wp.overlap)
+                    continue
+            scheduled.append((wp.kind, full, wp.overlap))
+        return [(kind, full) for kind, full, _ in scheduled]
+
+    def compile(self, waypoints: List[Waypoint], start_angles: List[float]) -> List[Segment]:
+        # 1. 解析出每个航点的 6 轴目标，去掉与上一位姿重合的航点
+        poses = []
+        pose = list(start_angles)
+        for kind, full in self._schedule(waypoints):
+            target = [pose[i] if a is None else a for i, a in enumerate(full)]
+            if max(abs(a - b) for a, b in zip(target, pose)) <= self.merge_tolerance:
+                continue
+            poses.append((kind, target))
+            pose = target
+
+        # 2. 去掉落在前后两点连线上的途经点
+        merged = []
+        prev = list(start_angles)
+        for i, (kind, target) in enumerate(poses):
+            nxt = poses[i + 1] if i + 1 < len(poses) else None
+            if kind == "move" and nxt is not None and nxt[0] == "move" and self._on_line(prev, target, nxt[1]):
+                continue
+            merged.append((kind, target))
+            prev = target
+
+        # 3. 计算每段时长，途经点提前下发下一段
+        #    时长按下发时舵机的预计位姿计算：途经点之后舵机只走完了 (1 - blend)，
+        #    若按上一段的名义目标计算，下一段时长偏短，舵机到不了位
+        segments = []
+        pose = list(start_angles)
+        for i, (kind, target) in enumerate(merged):
+            if kind == "grip":
+                segments.append(Segment(target, self.grip_time_ms, self.grip_dwell_ms))
+                pose = list(target)
+                continue
+            duration = self.duration_fn(target, pose)
+            if target[5] != pose[5]:
+                duration = max(duration, self.grip_time_ms)  # 与夹爪动作合并的段
+            is_via = i + 1 < len(merged) and merged[i + 1][0] == "move"
+            wait_ms = int(duration * (1.0 - self.blend)) if is_via else duration
+            segments.append(Segment(target, duration, wait_ms))
+            frac = wait_ms / duration if duration else 1.0
+            pose = [a + (b - a) * frac for a, b in zip(pose, target)]
+        return segments
+
+def execute_trajectory(arm, segments: List[Segment]):
+    """按段下发编译好的轨迹；arm.detector 存在时停止点和夹爪动作按回读确认到位"""
+    detector = getattr(arm, "detector", None)
+    cache = getattr(arm, "cache", None)
+    for seg in segments:
+        if cache is not None and cache.is_at({i + 1: a for i, a in enumerate(seg.angles)}):
+            cache.skip(seg.wait_ms)
+            continue
+        gripper_only = seg.angles[:5] == arm.servo_angles[:5]
+        gripper_moved = seg.angles[5] != arm.servo_angles[5]
+        if gripper_only:
+            arm.Arm_serial_servo_write(6, seg.angles[5], seg.s_time)  # 只动夹爪
+        else:
+            arm.Arm_serial_servo_write6(*seg.angles, seg.s_time)
+        if detector is None or seg.wait_ms < seg.s_time:
+            arm.wait(seg.wait_ms)  # 途经点按时间提前下发下一段
+        elif gripper_only:
+            detector.wait({6: seg.angles[5]}, seg.s_time)
+        else:
+            targets = {i + 1: seg.angles[i] for i in range(5)}
+            if gripper_moved:
+                targets[6] = seg.angles[5]  # 与关节同时运动的夹爪也要确认到位
+            detector.wait(targets, seg.s_time)
+
+# 颜色 -> 放置位姿
+COLOR_PLACES = {"黄色": "放置黄色", "红色": "放置红色", "绿色": "放置绿色", "蓝色": "放置蓝色"}
+
+class SortJobScheduler:
+    """批量分拣调度：把一批 (颜色, 数量) 排成一条连续编译的轨迹。
+
+    同色物品连续放置，颜色分组的先后顺序在所有排列中选关节总行程最小的一种
+    (行程相同时取轨迹时长较短者)。整批只编译一次，上一件的抬升直接与下一件的
+    准备位姿衔接，中间不再停顿。
+    """
+    def __init__(self, arm, compiler: MotionCompiler):
+        self.arm = arm
+        self.compiler = compiler
+
+    def waypoints(self, order: List[str]) -> List[Waypoint]:
+        return [wp for place in order for wp in sort_waypoints(self.arm.positions[place], self.arm)]
+
+    def plan_cost(self, order: List[str], start_angles: List[float]):
+        """(关节总行程 度, 轨迹时长 毫秒)"""
+        travel = 0.0
+        prev = list(start_angles)
+        segments = self.compiler.compile(self.waypoints(order), start_angles)
+        for seg in segments:
+            travel += sum(abs(a - b) for a, b in zip(seg.angles, prev))
+            prev = seg.angles
+        return travel, sum(seg.wait_ms for seg in segments)
+
+    def schedule(self, items: List, start_angles: List[float] = None) -> List[str]:
+        """items 为 [(颜色, 数量), ...]，返回放置位姿名的执行顺序"""
+        start_angles = self.arm.servo_angles if start_angles is None else start_angles
+        groups = []
+        for color, count in items:
+            if color not in COLOR_PLACES:
+                raise ValueError(f"未知的颜色: {color}")
+            if count > 0:
+                groups.append([COLOR_PLACES[color]] * int(count))
+        best = None
+        for perm in itertools.permutations(groups):
+            order = [place for group in perm for place in group]
+            cost = self.plan_cost(order, start_angles)
+            if best is None or cost < best[0]:
+                best = (cost, order)
+        return best[1] if best else []
+
+MOTION_COMPILER = MotionCompiler(duration_fn=ARM_DEVICE.move_duration)
+SORT_SCHEDULER = SortJobScheduler(ARM_DEVICE, MOTION_COMPILER)
+
+# =======================================================
+# ========== 运动执行器 (非阻塞下发 + 完成 Future) ==========
+# =======================================================
+
+class MotionExecutor:
+    """独占机械臂的运动执行线程。
+
+    所有舵机写入和运动等待都在这一个线程上按提交顺序执行，调用方立即拿到
+    concurrent.futures.Future (需要时 result() 等待完成，协程中可用
+    asyncio.wrap_future 包装后 await)。工具调用因此只是把动作排进队列，
+    Agent 可以在机械臂运动的同时解析下一条指令。
+    待执行队列有界，排队的动作过多时 submit 阻塞，对上游形成背压。
+
+    stop() 是急停通道：取消所有排队的动作，通过 arm.halt 打断正在进行的等待，
+    然后插队执行 arm_hold() 让舵机停在当前姿态。
+    """
+    def __init__(self, arm, max_pending: int = 8):
+        self.arm = arm
+        self._queue = queue.Queue(maxsize=max_pending)
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "interrupted": 0, "cancelled": 0,
+                         "coalesced": 0}
+        # 检测到停止指令 -> 下发保持命令的延迟 (毫秒)
+        self.stop_latencies: List[float] = []
+        self._thread = threading.Thread(target=self._worker, name="motion", daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """把 fn(*args, **kwargs) 排入运动队列，返回其 Future"""
+        future = Future()
+        self.counters["submitted"] += 1
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    def move(self, position: List[int], s_time: int = None) -> Future:
+        return self.submit(self.arm.arm_move, position, s_time)
+
+    def clamp(self, enable: int) -> Future:
+        return self.submit(self.arm.arm_clamp_block, enable)
+
+    def run_waypoints(self, waypoints: List[Waypoint], compiler: MotionCompiler) -> Future:
+        """在执行线程上编译并执行轨迹：起点取前面排队的动作全部完成后的舵机角度。
+
+        执行时队列头部紧接着的航点任务会被合并进同一条轨迹一起编译，使相邻工具
+        调用之间也能平滑衔接、并让舵机集合不相交的 overlap 航点同时执行。
+        """
+        return self.submit(self._run_waypoints, waypoints, compiler)
+
+    def _run_waypoints(self, waypoints: List[Waypoint], compiler: MotionCompiler):
+        execute_trajectory(self.arm, compiler.compile(waypoints, self.arm.servo_angles))
+
+    def _coalesce(self, futures: List[Future], waypoints: List[Waypoint], compiler: MotionCompiler):
+        """把队列头部连续的、使用同一编译器的航点任务并入当前任务"""
+        waypoints = list(waypoints)
+        with self._queue.mutex:
+            pending = self._queue.queue
+            while pending and pending[0][1] == self._run_waypoints and pending[0][2][1] is compiler:
+                future, _, (more, _), _ = pending.popleft()
+                if future.set_running_or_notify_cancel():
+                    futures.append(future)
+                    waypoints.extend(more)
+                    self.counters["coalesced"] += 1
+            self._queue.not_full.notify_all()
+        return waypoints, compiler
+
+    def stop(self, requested_at: float = None) -> Future:
+        """急停。requested_at 为检测到停止指令时的 time.perf_counter()，用于统计急停延迟"""
+        requested_at = requested_at or time.perf_counter()
+        self.arm.halt.set()
+        future = Future()
+        self._cancel_pending()
+        while True:
+            try:
+                self._queue.put_nowait((future, self._hold, (requested_at,), {}))
+                return future
+            except queue.Full:
+                self._cancel_pending()
+
+    def _cancel_pending(self):
+        while True:
+            try:
+                future = self._queue.get_nowait()[0]
+            except queue.Empty:
+                return
+            if future.cancel():
+                self.counters["cancelled"] += 1
+
+    def _hold(self, requested_at: float) -> float:
+        self.arm.halt.clear()
+        self.arm.arm_hold()
+        latency = (time.perf_counter() - requested_at) * 1000
+        self.stop_latencies.append(latency)
+        print(f"🛑 已急停并保持当前姿态 ({latency:.1f}ms)")
+        return latency
+
+    def wait_idle(self, timeout: float = None):
+        """等待此前提交的所有动作执行完毕"""
+        self.submit(lambda: None).result(timeout)
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def stats(self) -> Dict[str, Any]:
+        report = dict(self.counters, pending=self.pending())
+        if self.stop_latencies:
+            report["stop_latency_ms"] = {"last": round(self.stop_latencies[-1], 1),
+                                         "max": round(max(self.stop_latencies), 1)}
+        return report
+
+    def _worker(self):
+        while True:
+            future, fn, args, kwargs = self._queue.get()
+            # 急停已触发、保持命令尚未执行时，漏网的排队动作一律取消
+            if self.arm.halt.is_set() and fn != self._hold:
+                if future.cancel():
+                    self.counters["cancelled"] += 1
+            if not future.set_running_or_notify_cancel():
+                continue
+            futures = [future]
+            if fn == self._run_waypoints:
+                args = self._coalesce(futures, *args)
+            try:
+                result = fn(*args, **kwargs)
+            except MotionInterrupted as e:
+                self.counters["interrupted"] += len(futures)
+                print("⏹️ 正在执行的动作已被急停打断")
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            except Exception as e:
+                self.counters["failed"] += len(futures)
+                print(f"🚨 机械臂动作执行出错: {e}")
+                for f in futures:
+                    f.set_exception(e)
+                continue
+            self.counters["completed"] += len(futures)
+            for f in futures:
+                f.set_result(result)
+
+MOTION_EXECUTOR = MotionExecutor(ARM_DEVICE)
+
+def init_waypoints() -> List[Waypoint]:
+    # 与原流程一致：先在原地松开夹爪并等待，再回初始位置 (不能在转向途中松开，否则夹着的物体会掉落)
+    return [grip(0), move_to(ARM_DEVICE.positions["初始位置"])]
+
+def reset_arm() -> Future:
+    """CLI reset：回读全部舵机与状态缓存对账后复位，两步作为同一个运动任务排队，调用方不等待。
+
+    已在初始位置的关节不会重复写入。急停会取消整个任务 (或打断正在执行的复位)，
+    此时只提示一次，不会把取消当作错误抛给调用方。
+    """
+    def reset():
+        corrected = ARM_DEVICE.reconcile()
+        if corrected:
+            print(f"舵机状态缓存已按回读校准: {corrected}")
+        execute_trajectory(ARM_DEVICE, MOTION_COMPILER.compile(init_waypoints(), ARM_DEVICE.servo_angles))
+
+    def done(future: Future):
+        if future.cancelled():
+            print("⏹️ 复位任务已被急停取消")
+
+    future = MOTION_EXECUTOR.submit(reset)
+    future.add_done_callback(done)
+    return future
 
 # 机械臂动作工具 (LangChain Tool) - 仅列举部分，其余类似
+# 工具只把航点交给 MOTION_EXECUTOR 排队，不等待机械臂运动完成
 @tool
 def action_init() -> str:
     """初始化机械臂到初始位置，执行复位或重置操作。"""
     print("✅ Tool Call: action_init")
-    ARM_DEVICE.arm_clamp_block(0)
-    ARM_DEVICE.arm_move(ARM_DEVICE.positions["初始位置"], 1000)
-    return "机械臂已初始化并复位到初始位置。"
+    MOTION_EXECUTOR.run_waypoints(init_waypoints(), MOTION_COMPILER)
+    return "机械臂复位动作已下发，将回到初始位置。"
 
 @tool
 def action_ready() -> str:
     """移动机械臂到准备/待机位置，准备接收抓取指令。"""
     print("✅ Tool Call: action_ready")
-    ARM_DEVICE.arm_move(ARM_DEVICE.positions["准备位置"], 1000)
-    return "机械臂已移动到准备/待机位置。"
+    MOTION_EXECUTOR.run_waypoints([move_to(ARM_DEVICE.positions["准备位置"])], MOTION_COMPILER)
+    return "机械臂正在移动到准备/待机位置。"
 
 @tool
 def action_grab() -> str:
     """移动机械臂到抓取位置，并夹紧夹爪，执行夹取操作。"""
     print("✅ Tool Call: action_grab")
-    ARM_DEVICE.arm_move(ARM_DEVICE.positions["抓取位置"], 1000)
-    ARM_DEVICE.arm_clamp_block(1)
-    return "机械臂已移动到抓取位置并夹紧夹爪。"
+    MOTION_EXECUTOR.run_waypoints([move_to(ARM_DEVICE.positions["抓取位置"]), grip(1)], MOTION_COMPILER)
+    return "机械臂正在移动到抓取位置，到位后夹紧夹爪。"
 
 @tool
 def action_release() -> str:
     """松开夹爪，释放夹取的物体。"""
     print("✅ Tool Call: action_release")
-    ARM_DEVICE.arm_clamp_block(0)
-    return "机械臂已松开夹爪，释放物体。"
+    MOTION_EXECUTOR.run_waypoints([grip(0)], MOTION_COMPILER)
+    return "机械臂将松开夹爪，释放物体。"
 
 @tool
 def action_sort_yellow() -> str:
     """执行分拣黄色物品的完整流程：完整抓取序列 -> 放置黄色 -> 释放 -> 向上抬升。"""
     print("✅ Tool Call: action_sort_yellow")
-    # 模拟组合动作的调用
-    action_ready()
-    action_grab()
-    ARM_DEVICE.arm_move_up() 
-    ARM_DEVICE.arm_move(ARM_DEVICE.positions["放置黄色"], 1000)
-    action_release()
-    ARM_DEVICE.arm_move_up() 
-    return "黄色分拣流程已执行。"
+    # 整个流程编译成一条轨迹执行，途经点不停顿
+    MOTION_EXECUTOR.run_waypoints(sort_waypoints(ARM_DEVICE.positions["放置黄色"]), MOTION_COMPILER)
+    return "黄色分拣流程已下发。"
+
+@tool
+def action_sort_batch(yellow: int = 0, red: int = 0, green: int = 0, blue: int = 0) -> str:
+    """批量分拣多个物品：参数为黄色、红色、绿色、蓝色物品各自的数量，整批一次规划并连续执行。"""
+    print(f"✅ Tool Call: action_sort_batch (黄 {yellow}, 红 {red}, 绿 {green}, 蓝 {blue})")
+    items = [("黄色", yellow), ("红色", red), ("绿色", green), ("蓝色", blue)]
+    order = SORT_SCHEDULER.schedule(items)
+    if not order:
+        return "没有需要分拣的物品。"
+    MOTION_EXECUTOR.run_waypoints(SORT_SCHEDULER.waypoints(order), MOTION_COMPILER)
+    return f"批量分拣已下发，共 {len(order)} 件，顺序: {'、'.join(p[2:] for p in order)}。"
 
 # 完整的工具列表
 ALL_ARM_TOOLS = [
     action_init, action_ready, action_grab, action_release, 
-    action_sort_yellow, # ... 其他所有动作都应该在此处列出
+    action_sort_yellow, action_sort_batch, # ... 其他所有动作都应该在此处列出
 ]
 
 # RAG 数据源创建 (用于增强 Agent 的意图识别)
@@ -132,6 +836,7 @@ action_data = [
     ("释放", "action_release", "松开夹爪，放开，释放物体"),
     ("向上移动", "action_move_up", "向上抬升，上升，升高，抬高机械臂"),
     ("分拣黄色", "action_sort_yellow", "分拣到黄色区域的完整流程，黄色分拣，将物体放到黄色的地方"),
+    ("批量分拣", "action_sort_batch", "一次分拣多个物品，几个黄色和几个红色，按颜色和数量分拣"),
     # ... 其他动作
 ]
 
@@ -145,16 +850,782 @@ for name, id_func, description in action_data:
         )
     )
 
-vector_store = InMemoryVectorStore.from_documents(
-    rag_documents,
-    embedding=FakeEmbeddings(size=128)
-)
-RAG_RETRIEVER = vector_store.as_retriever(k=3)
+# =======================================================
+# ========== 本地快速意图匹配 (绕过 LLM 的快速通道) ==========
+# =======================================================
 
-# Agent 执行函数
-def setup_langchain_agent(llm, tools: List, retriever: BaseRetriever):
-    """设置 LangChain Agent"""
-    RAG_CONTEXT_PROMPT = """
+# 指令中常见的礼貌用语/口头语，不影响意图判断
+FILLER_WORDS = ("请", "帮我", "给我", "一下", "吧", "把", "机械臂", "现在", "马上", "执行", "动作")
+# 含否定词的指令交给 LLM 处理，避免"不释放"、"不要抓取"被误判为"释放"、"抓取"
+# (单字否定词已覆盖 "不要"、"不用"、"没有" 等)
+NEGATION_WORDS = ("不", "没", "别", "甭", "勿", "莫", "取消")
+# 剩余部分含数量 (交给批量分拣) 或疑问语气时交给 LLM，避免"抓取两次"只执行一次、"释放了吗"触发动作
+_COUNT_OR_QUESTION_RE = re.compile(r"[0-9零一二两三四五六七八九十百几次个遍吗呢么]")
+# 停止类指令绕过 LLM 直接急停，宁可误停：文本中含有任一停止词即视为停止指令
+STOP_WORDS = ("停", "别动", "stop")
+_PUNCT_RE = re.compile(r"[\s,.!?;:'\"()，。！？；：、…“”‘’（）]+")
+
+def normalize_command(text: str) -> str:
+    """全角转半角、统一小写，并去除指令中的标点和空白"""
+    return _PUNCT_RE.sub("", unicodedata.normalize("NFKC", text).lower())
+
+def is_stop_command(text: str) -> bool:
+    normalized = normalize_command(text)
+    return any(word in normalized for word in STOP_WORDS)
+
+class IntentMatcher:
+    """基于 Aho-Corasick 多模式自动机的本地意图匹配器。
+
+    模式串来自 action_data 中的动作名和别名。只有当指令唯一地命中一个工具、
+    且除去命中部分和口头语后几乎没有剩余内容、剩余部分也不含数量或疑问语气时才直接派发，
+    其余情况返回 None，交由 LLM Agent 处理。
+    """
+    def __init__(self, action_data: List, tools: List, max_residual: int = 2):
+        self.tools = {t.name: t for t in tools}
+        self.max_residual = max_residual
+        # 自动机状态: 转移表、失败指针、输出 (模式长度, 工具名)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List] = [[]]
+        for name, tool_name, description in action_data:
+            if tool_name not in self.tools or self.tools[tool_name].args:
+                continue  # 没有对应工具、或工具需要参数的动作不参与快速匹配
+            for alias in [name] + description.split("，"):
+                alias = normalize_command(alias)
+                if alias:
+                    self._add_pattern(alias, tool_name)
+        self._build()
+
+    def _add_pattern(self, pattern: str, tool_name: str):
+        state = 0
+        for ch in pattern:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((len(pattern), tool_name))
+
+    def _build(self):
+        """BFS 构建失败指针"""
+        pending = list(self._goto[0].values())  # 根的子节点失败指针均为 0
+        while pending:
+            state = pending.pop(0)
+            for ch, nxt in self._goto[state].items():
+                pending.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List:
+        """返回所有命中 [(start, end, tool_name), ...]"""
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, tool_name in self._out[state]:
+                hits.append((i + 1 - length, i + 1, tool_name))
+        return hits
+
+    def match(self, text: str):
+        """返回唯一命中的工具，歧义或未命中时返回 None"""
+        if "?" in text or "？" in text:
+            return None
+        text = normalize_command(text)
+        if not text or any(w in text for w in NEGATION_WORDS):
+            return None
+        hits = self.find(text)
+        # 被其它工具更长的命中完全包含的短命中视为噪声
+        hits = [h for h in hits if not any(
+            o[2] != h[2] and o[0] <= h[0] and h[1] <= o[1] and (o[1] - o[0]) > (h[1] - h[0])
+            for o in hits)]
+        tool_names = {h[2] for h in hits}
+        if len(tool_names) != 1:
+            return None
+        covered = [False] * len(text)
+        for start, end, _ in hits:
+            covered[start:end] = [True] * (end - start)
+        residual = "".join(ch for ch, c in zip(text, covered) if not c)
+        for word in FILLER_WORDS:
+            residual = residual.replace(word, "")
+        if len(residual) > self.max_residual or _COUNT_OR_QUESTION_RE.search(residual):
+            return None
+        return self.tools[tool_names.pop()]
+
+INTENT_MATCHER = IntentMatcher(action_data, ALL_ARM_TOOLS)
+
+# =======================================================
+# ========== 拼音纠错 (识别结果中的同音字/近音字) ==========
+# =======================================================
+
+# 内置拼音表 (不带声调)：覆盖动作名/别名用字及其常见同音字，仅在未安装 pypinyin 时使用
+PINYIN_TABLE = {
+    "an": "按安暗岸", "bei": "备被背倍杯北悲", "bi": "臂比笔必币闭", "bing": "并病兵冰饼",
+    "cheng": "程成城称承乘", "chong": "重冲虫充", "chu": "初出处除储触楚", "ci": "次此词刺瓷磁",
+    "dai": "待代带袋戴呆", "dao": "到道倒导刀岛", "de": "的得德", "di": "地第低底敌弟递",
+    "dong": "动东冬懂洞冻", "duo": "多朵夺躲", "fang": "放方房防访仿芳", "fen": "分份粉纷奋芬",
+    "fu": "复服父副福夫负附扶", "gao": "高搞告稿", "ge": "个各歌哥格隔", "he": "和合河何盒核贺",
+    "hong": "红洪宏虹轰", "hua": "化话花华画划滑", "huang": "黄皇慌晃谎煌凰", "hui": "回会灰挥汇惠毁",
+    "ji": "几机级及即记纪技击极集急挤基积迹", "jia": "夹家加假价甲架佳", "jian": "拣捡件见建简检减间坚",
+    "jiang": "将江讲奖降姜", "jie": "接节结解街姐界借", "jin": "紧进近今金尽", "kai": "开凯慨",
+    "lan": "蓝兰栏拦篮烂", "liang": "量两亮凉粮辆", "ling": "令另领灵零铃岭", "liu": "流六刘留柳",
+    "lv": "绿律率虑旅", "pi": "批皮匹劈", "pin": "品拼频贫", "qi": "起其期气器汽齐奇骑棋",
+    "qu": "取区去曲趣屈渠", "se": "色瑟塞", "shang": "上尚伤商赏", "sheng": "升生声省胜绳圣",
+    "shi": "始是时事使十市实式试释石识适", "shou": "收手首受守寿售", "shu": "数书树属输熟术",
+    "song": "松送宋颂", "tai": "抬太台态泰", "ti": "体题提替梯", "wan": "完万晚玩碗湾",
+    "wei": "位为未维围委卫伟味", "wu": "物五无午舞误屋", "xiang": "向想像相香项箱象响",
+    "xie": "械些写谢鞋斜协", "xing": "行型性星形醒", "yan": "颜眼言严验演烟盐",
+    "yi": "一衣医依伊移以已意亿易义", "yu": "域与于雨鱼语玉遇", "zheng": "整正证政争征",
+    "zhi": "执指只直支制值止纸治智置", "zhu": "住主注助猪竹煮珠驻", "zhua": "抓爪", "zhun": "准",
+    "zun": "尊遵", "zuo": "作做坐座左昨",
+}
+_CHAR_PINYIN = {ch: syllable for syllable, chars in PINYIN_TABLE.items() for ch in chars}
+
+def to_pinyin(text: str) -> List[str]:
+    """逐字转成不带声调的拼音，非汉字或未收录的字保留原字"""
+    if lazy_pinyin is not None:
+        return lazy_pinyin(list(text))
+    return [_CHAR_PINYIN.get(ch, ch) for ch in text]
+
+@lru_cache(maxsize=4096)
+def edit_distance(a: str, b: str) -> int:
+    """Levenshtein 编辑距离 (用于单个拼音音节，结果缓存)"""
+    if len(a) < len(b):
+        a, b = b, a
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+def syllable_distance(a: tuple, b: tuple) -> int:
+    """等长音节序列逐位音节编辑距离之和 (同音/近音字是逐字替换，无需对齐)"""
+    return sum(edit_distance(x, y) for x, y in zip(a, b))
+
+class BKTree:
+    """音节距离上的 BK 树：按三角不等式剪枝，查询半径 r 内的全部词条"""
+    def __init__(self):
+        self._root = None  # 节点: [音节序列, 值列表, {距离: 子节点}]
+
+    def add(self, key: tuple, value):
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            d = syllable_distance(key, node[0])
+            if d == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: tuple, radius: int) -> List:
+        """返回 [(距离, 值), ...]"""
+        results = []
+        pending = [self._root] if self._root is not None else []
+        while pending:
+            node = pending.pop()
+            d = syllable_distance(key, node[0])
+            if d <= radius:
+                results.extend((d, value) for value in node[1])
+            for child_d, child in node[2].items():
+                if d - radius <= child_d <= d + radius:
+                    pending.append(child)
+        return results
+
+class PinyinCorrector:
+    """把识别文本中与动作名/别名读音相同或相近的片段替换为正确写法。
+
+    词条为 action_data 的动作名、别名以及分拣颜色，按字数分别建音节 BK 树。
+    对识别文本按词条字数滑窗，窗口与词条逐字音节编辑距离之和不超过允许值
+    (2~3 字 1，4 字以上 2，单字不纠错)、且每个音节最多差 1 时视为误识别。
+    protected_chars 中的字 (颜色) 必须读音完全相同才能替换，原文中已与某个
+    词条写法一致的片段不会被改动，避免 "分拣红色" 被改成 "分拣黄色"。
+    候选按字数从长到短、距离从小到大不重叠地选取，同一窗口有多个不同的
+    最佳词条时不纠错。
+    """
+    def __init__(self, action_data: List, extra_terms=(), protected_chars: str = ""):
+        self._trees: Dict[int, BKTree] = {}
+        self.protected_chars = set(protected_chars)
+        terms = set(extra_terms)
+        for name, _, description in action_data:
+            terms.update(normalize_command(alias) for alias in [name] + description.split("，"))
+        self._terms = {term: tuple(to_pinyin(term)) for term in terms if len(term) >= 2}
+        for term, syllables in self._terms.items():
+            self._trees.setdefault(len(term), BKTree()).add(syllables, term)
+        self.stats = {"queries": 0, "corrected": 0}
+
+    @staticmethod
+    def _radius(length: int) -> int:
+        return 1 if length <= 3 else 2
+
+    def _acceptable(self, window: str, syllables: tuple, term: str, locked: List[bool]) -> bool:
+        """逐字检查替换：每个音节最多差 1，颜色字须同音，已是正确词条的字不能改"""
+        for ch, syllable, term_ch, term_syllable, fixed in zip(window, syllables, term, self._terms[term], locked):
+            if ch == term_ch:
+                continue
+            if fixed or edit_distance(syllable, term_syllable) > 1:
+                return False
+            if (ch in self.protected_chars or term_ch in self.protected_chars) and syllable != term_syllable:
+                return False
+        return True
+
+    def candidates(self, text: str) -> List:
+        """返回 [(start, end, 词条, 距离), ...]，只包含与原文写法不同的窗口"""
+        syllables = tuple(to_pinyin(text))
+        # 原文中已与词条写法一致的字
+        locked = [False] * len(text)
+        for length in self._trees:
+            for start in range(len(text) - length + 1):
+                if text[start:start + length] in self._terms:
+                    locked[start:start + length] = [True] * length
+        found = []
+        for length, tree in self._trees.items():
+            for start in range(len(text) - length + 1):
+                window = text[start:start + length]
+                hits = tree.search(syllables[start:start + length], self._radius(length))
+                if not hits or any(term == window for _, term in hits):
+                    continue
+                hits = [(d, term) for d, term in hits if self._acceptable(
+                    window, syllables[start:start + length], term, locked[start:start + length])]
+                if not hits:
+                    continue
+                best = min(d for d, _ in hits)
+                terms = {term for d, term in hits if d == best}
+                if len(terms) == 1:
+                    found.append((start, start + length, terms.pop(), best))
+        return found
+
+    def correct(self, text: str) -> str:
+        """返回纠错后的文本 (已归一化)；没有可纠正的片段时返回归一化后的原文"""
+        self.stats["queries"] += 1
+        text = normalize_command(text)
+        chosen = []
+        for start, end, term, _ in sorted(self.candidates(text), key=lambda c: (c[0] - c[1], c[3], c[0])):
+            if all(end <= s or e <= start for s, e, _ in chosen):
+                chosen.append((start, end, term))
+        if not chosen:
+            return text
+        self.stats["corrected"] += 1
+        for start, end, term in sorted(chosen, reverse=True):
+            text = text[:start] + term + text[end:]
+        return text
+
+PINYIN_CORRECTOR = PinyinCorrector(action_data, extra_terms=COLOR_PLACES, protected_chars="".join(COLOR_PLACES))
+
+# =======================================================
+# ========== 本地向量检索 (RAG 动作检索) ==========
+# =======================================================
+
+class HashingEmbeddings(Embeddings):
+    """离线的字符 n-gram 哈希向量化，不依赖模型与网络。
+
+    文本经 normalize_command 归一化后取 ngram_range 内的全部字符 n-gram，
+    用 crc32 哈希到 size 维 (哈希值的一位决定正负号，抵消碰撞偏差)，
+    词频取对数后 L2 归一化。向量按文本内容哈希缓存，同一文本只计算一次。
+    """
+    def __init__(self, size: int = 1024, ngram_range=(1, 3)):
+        self.size = size
+        self.ngram_range = ngram_range
+        self._cache: Dict[str, np.ndarray] = {}
+        self.cache_stats = {"hits": 0, "misses": 0}
+
+    def _vector(self, text: str) -> np.ndarray:
+        text = normalize_command(text)
+        counts: Dict[int, float] = {}
+        lo, hi = self.ngram_range
+        for n in range(lo, hi + 1):
+            for i in range(len(text) - n + 1):
+                h = zlib.crc32(text[i:i + n].encode("utf-8"))
+                index = h % self.size
+                counts[index] = counts.get(index, 0.0) + (1.0 if h & 0x80000000 else -1.0)
+        vec = np.zeros(self.size, dtype=np.float32)
+        for index, c in counts.items():
+            vec[index] = math.copysign(1.0 + math.log(abs(c)), c) if c else 0.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def embed_array(self, texts: List[str]) -> np.ndarray:
+        """批量向量化，返回 (len(texts), size) 的 float32 矩阵"""
+        out = np.empty((len(texts), self.size), dtype=np.float32)
+        for row, text in enumerate(texts):
+            key = hashlib.sha1(text.encode("utf-8")).hexdigest()
+            vec = self._cache.get(key)
+            if vec is None:
+                self.cache_stats["misses"] += 1
+                vec = self._cache[key] = self._vector(text)
+            else:
+                self.cache_stats["hits"] += 1
+            out[row] = vec
+        return out
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_array(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._vector(text).tolist()
+
+class VectorIndexRetriever(BaseRetriever):
+    """NumPy 矩阵打分的向量检索器。
+
+    文档向量组成 (N, D) 的 float32 矩阵，查询时一次矩阵-向量乘法得到全部余弦
+    相似度，再用 argpartition 取 top-k，不逐条遍历文档。
+    """
+    embeddings: Any
+    documents: List[Document]
+    matrix: Any
+    k: int = 3
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], embeddings: HashingEmbeddings, k: int = 3):
+        matrix = embeddings.embed_array([doc.page_content for doc in documents])
+        return cls(embeddings=embeddings, documents=documents, matrix=matrix, k=k)
+
+    def search(self, query: str, k: int = None) -> List:
+        """返回 [(文档下标, 相似度), ...]，按相似度从高到低"""
+        k = min(k or self.k, len(self.documents))
+        if k <= 0:
+            return []
+        scores = self.matrix @ self.embeddings._vector(query)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.documents[i] for i, _ in self.search(query)]
+
+class IVFIndexRetriever(BaseRetriever):
+    """倒排文件 (IVF) 近似最近邻检索器，用于数万条以上的动作文档。
+
+    用球面 k-means 把文档向量划分为 nlist 个簇，每个簇单独保存 (文档下标, 向量矩阵)。
+    查询时先与全部簇中心打分，只在得分最高的 nprobe 个簇内精确打分取 top-k：
+    nprobe 越大召回越高、延迟越大，nprobe = nlist 时等价于暴力检索。
+    add_documents 把新文档追加到最近的簇，不重新聚类；大量插入后应重建索引。
+    """
+    embeddings: Any
+    documents: List[Document]
+    centroids: Any
+    list_ids: List[Any]
+    list_vectors: List[Any]
+    k: int = 3
+    nprobe: int = 8
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], embeddings: HashingEmbeddings, **kwargs):
+        vectors = embeddings.embed_array([doc.page_content for doc in documents])
+        return cls.from_vectors(documents, vectors, embeddings, **kwargs)
+
+    @classmethod
+    def from_vectors(cls, documents: List[Document], vectors: np.ndarray, embeddings: HashingEmbeddings,
+                     nlist: int = None, nprobe: int = 8, k: int = 3, iterations: int = 10, seed: int = 0):
+        """用已经算好的 (N, D) 文档向量建索引，nlist 默认取 sqrt(N)"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        nlist = max(1, min(nlist or int(math.sqrt(len(vectors))), len(vectors)))
+        centroids = cls._train_centroids(vectors, nlist, iterations, np.random.default_rng(seed))
+        retriever = cls(embeddings=embeddings, documents=[], centroids=centroids,
+                        list_ids=[np.empty(0, dtype=np.int64)] * nlist,
+                        list_vectors=[np.empty((0, vectors.shape[1]), dtype=np.float32)] * nlist,
+                        k=k, nprobe=nprobe)
+        retriever._insert(documents, vectors)
+        return retriever
+
+    @staticmethod
+    def _train_centroids(vectors: np.ndarray, nlist: int, iterations: int, rng) -> np.ndarray:
+        """球面 k-means：在最多 64 * nlist 个采样向量上训练，簇中心 L2 归一化"""
+        train = vectors[rng.choice(len(vectors), min(len(vectors), 64 * nlist), replace=False)]
+        centroids = train[rng.choice(len(train), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assign = np.argmax(train @ centroids.T, axis=1)
+            counts = np.bincount(assign, minlength=nlist)
+            order = np.argsort(assign, kind="stable")
+            filled = counts > 0
+            starts = (np.cumsum(counts) - counts)[filled]
+            centroids[filled] = np.add.reduceat(train[order], starts, axis=0)
+            # 空簇重新随机取一个样本作为中心
+            centroids[~filled] = train[rng.choice(len(train), int((~filled).sum()))]
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            centroids /= np.where(norms > 0, norms, 1.0)
+        return centroids
+
+    def _insert(self, documents: List[Document], vectors: np.ndarray):
+        first = len(self.documents)
+        self.documents.extend(documents)
+        assign = np.argmax(vectors @ self.centroids.T, axis=1)
+        for c in np.unique(assign):
+            rows = np.flatnonzero(assign == c)
+            self.list_ids[c] = np.concatenate([self.list_ids[c], rows + first])
+            self.list_vectors[c] = np.concatenate([self.list_vectors[c], vectors[rows]])
+
+    def add_documents(self, documents: List[Document]):
+        """增量插入文档：向量化后追加到最近簇中心对应的倒排表"""
+        self._insert(documents, self.embeddings.embed_array([doc.page_content for doc in documents]))
+
+    def search(self, query: str, k: int = None, nprobe: int = None) -> List:
+        """返回 [(文档下标, 相似度), ...]，按相似度从高到低 (近似结果)"""
+        q = self.embeddings._vector(query)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(self.centroids @ q), nprobe - 1)[:nprobe]
+        ids = np.concatenate([self.list_ids[c] for c in probes])
+        scores = np.concatenate([self.list_vectors[c] @ q for c in probes])
+        k = min(k or self.k, len(ids))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """导出为连续数组用于持久化：簇中心、按簇排列的文档下标与向量、各簇在其中的起止偏移"""
+        sizes = [len(ids) for ids in self.list_ids]
+        return {
+            "centroids": np.asarray(self.centroids, dtype=np.float32),
+            "ivf_ids": np.concatenate(self.list_ids).astype(np.int64),
+            "ivf_offsets": np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64),
+            "ivf_vectors": np.concatenate(self.list_vectors).astype(np.float32),
+        }
+
+    @classmethod
+    def from_arrays(cls, documents: List[Document], embeddings: HashingEmbeddings, arrays: Dict[str, np.ndarray],
+                    nprobe: int = 8, k: int = 3):
+        """由 to_arrays 的结果 (可以是内存映射) 恢复索引，各倒排表是切片视图，不复制也不重新聚类"""
+        offsets = arrays["ivf_offsets"]
+        bounds = list(zip(offsets[:-1], offsets[1:]))
+        return cls(embeddings=embeddings, documents=list(documents), centroids=arrays["centroids"],
+                   list_ids=[arrays["ivf_ids"][a:b] for a, b in bounds],
+                   list_vectors=[arrays["ivf_vectors"][a:b] for a, b in bounds],
+                   k=k, nprobe=nprobe)
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.documents[i] for i, _ in self.search(query)]
+
+def char_bigrams(text: str) -> List[str]:
+    """归一化后切成字符二元组，不依赖分词器；单字文本保留该字"""
+    text = normalize_command(text)
+    if len(text) < 2:
+        return [text] if text else []
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+class LexicalRetriever(BaseRetriever):
+    """字符二元组倒排索引 + BM25 打分的词面检索器。
+
+    建索引时把每个词项在每篇文档上的 BM25 得分预先算好存入倒排表
+    (文档下标数组, 得分数组)，查询时只需把命中词项的得分数组累加到对应文档上。
+    """
+    documents: List[Document]
+    postings: Dict[str, Any]
+    k: int = 3
+
+    @classmethod
+    def from_documents(cls, documents: List[Document], k: int = 3, k1: float = 1.5, b: float = 0.75):
+        tokenized = [char_bigrams(doc.page_content) for doc in documents]
+        avgdl = sum(len(t) for t in tokenized) / max(len(tokenized), 1) or 1.0
+        tf: Dict[str, Dict[int, int]] = {}
+        for doc_id, tokens in enumerate(tokenized):
+            for token in tokens:
+                counts = tf.setdefault(token, {})
+                counts[doc_id] = counts.get(doc_id, 0) + 1
+        postings = {}
+        n = len(documents)
+        for token, counts in tf.items():
+            idf = math.log(1 + (n - len(counts) + 0.5) / (len(counts) + 0.5))
+            ids = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            freqs = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            lengths = np.array([len(tokenized[i]) for i in ids], dtype=np.float32)
+            weights = idf * freqs * (k1 + 1) / (freqs + k1 * (1 - b + b * lengths / avgdl))
+            postings[token] = (ids, weights.astype(np.float32))
+        return cls(documents=documents, postings=postings, k=k)
+
+    def search(self, query: str, k: int = None) -> List:
+        """返回 [(文档下标, BM25 得分), ...]，按得分从高到低，只包含有词项命中的文档"""
+        k = k or self.k
+        scores = np.zeros(len(self.documents), dtype=np.float32)
+        for token in set(char_bigrams(query)):
+            posting = self.postings.get(token)
+            if posting is not None:
+                scores[posting[0]] += posting[1]  # 同一倒排表内文档下标不重复
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.documents[i] for i, _ in self.search(query)]
+
+class HybridRetriever(BaseRetriever):
+    """多个检索器结果的倒数排名融合 (RRF): 文档得分为各检索器中 1 / (rrf_k + 名次) 之和。
+
+    各子检索器取前 candidates 个结果参与融合。提供 search() 的子检索器须与
+    documents 使用同一份文档列表 (按下标融合)；其余检索器经 invoke() 检索，
+    按 page_content 对应回文档下标。
+    """
+    documents: List[Document]
+    retrievers: List[Any]
+    k: int = 3
+    candidates: int = 10
+    rrf_k: int = 60
+
+    def _ranked(self, retriever, query: str) -> List[int]:
+        if hasattr(retriever, "search"):
+            return [i for i, _ in retriever.search(query, self.candidates)]
+        positions = {doc.page_content: i for i, doc in enumerate(self.documents)}
+        docs = retriever.invoke(query)[:self.candidates]
+        return [positions[doc.page_content] for doc in docs if doc.page_content in positions]
+
+    def search(self, query: str, k: int = None) -> List:
+        """返回 [(文档下标, RRF 得分), ...]，按得分从高到低"""
+        fused: Dict[int, float] = {}
+        for retriever in self.retrievers:
+            for rank, i in enumerate(self._ranked(retriever, query)):
+                fused[i] = fused.get(i, 0.0) + 1.0 / (self.rrf_k + rank + 1)
+        return sorted(fused.items(), key=lambda item: -item[1])[:k or self.k]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [self.documents[i] for i, _ in self.search(query)]
+
+# 持久化的动作索引: <目录>/meta.json (格式版本、校验和、索引类型、动作元数据) + 若干 .npy 数组，
+# 启动时内存映射，不重新计算。动作数量达到 ANN_MIN_DOCUMENTS 后改用 IVF 近似检索 (否则暴力检索
+# 更快也更准)，此时保存的是簇中心和按簇排列的倒排表，启动时也不重新跑 k-means
+ACTION_INDEX_VERSION = 2
+ACTION_INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "action_index")
+ANN_MIN_DOCUMENTS = 5000
+
+def action_index_kind(documents: List[Document]) -> str:
+    return "ivf" if len(documents) >= ANN_MIN_DOCUMENTS else "flat"
+
+def action_index_checksum(documents: List[Document], embeddings: HashingEmbeddings) -> str:
+    """动作文档、向量化参数和索引类型的校验和，任何一项变化都需要重建索引"""
+    payload = json.dumps(
+        {"version": ACTION_INDEX_VERSION, "size": embeddings.size, "ngram_range": list(embeddings.ngram_range),
+         "kind": action_index_kind(documents),
+         "documents": [[doc.page_content, doc.metadata] for doc in documents]},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def build_action_index(path: str, documents: List[Document], embeddings: HashingEmbeddings,
+                       k: int = 3) -> BaseRetriever:
+    """向量化全部动作文档 (必要时聚类) 并写入 path，写入失败时仍返回内存中的索引"""
+    kind = action_index_kind(documents)
+    if kind == "ivf":
+        retriever = IVFIndexRetriever.from_documents(documents, embeddings, k=k)
+        arrays = retriever.to_arrays()
+    else:
+        retriever = VectorIndexRetriever.from_documents(documents, embeddings, k=k)
+        arrays = {"vectors": retriever.matrix}
+    meta = {
+        "version": ACTION_INDEX_VERSION,
+        "checksum": action_index_checksum(documents, embeddings),
+        "kind": kind,
+        "count": len(documents),
+        "dim": embeddings.size,
+        "arrays": sorted(arrays),
+        "actions": [doc.metadata for doc in documents],
+    }
+    try:
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            array_path = os.path.join(path, name + ".npy")
+            with open(array_path + ".tmp", "wb") as f:
+                np.save(f, array)
+            os.replace(array_path + ".tmp", array_path)
+        # meta.json 最后写入：中途失败时旧的校验和对不上，下次启动会重建
+        meta_path = os.path.join(path, "meta.json")
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(meta_path + ".tmp", meta_path)
+    except OSError as e:
+        print(f"⚠️ 动作索引写入失败: {e}")
+    return retriever
+
+def _mapped_action_index(path: str, meta: dict, documents: List[Document], embeddings: HashingEmbeddings,
+                         k: int) -> Optional[BaseRetriever]:
+    """内存映射 meta 对应的数组并检查形状，不一致时返回 None"""
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in meta["arrays"]}
+    n, dim = len(documents), embeddings.size
+    if meta["kind"] == "flat":
+        matrix = arrays["vectors"]
+        if matrix.dtype == np.float32 and matrix.shape == (n, dim):
+            return VectorIndexRetriever(embeddings=embeddings, documents=documents, matrix=matrix, k=k)
+    elif meta["kind"] == "ivf":
+        centroids, offsets = arrays["centroids"], arrays["ivf_offsets"]
+        if (centroids.dtype == np.float32 and centroids.ndim == 2 and centroids.shape[1] == dim
+                and offsets.shape == (len(centroids) + 1,) and offsets[0] == 0 and offsets[-1] == n
+                and arrays["ivf_ids"].shape == (n,) and arrays["ivf_vectors"].shape == (n, dim)
+                and arrays["ivf_vectors"].dtype == np.float32):
+            return IVFIndexRetriever.from_arrays(documents, embeddings, arrays, k=k)
+    return None
+
+def load_action_index(path: str, documents: List[Document], embeddings: HashingEmbeddings,
+                      k: int = 3) -> BaseRetriever:
+    """内存映射加载 path 下的动作索引；不存在、格式版本、校验和或数组形状不一致时重建"""
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["version"] == ACTION_INDEX_VERSION and meta["checksum"] == action_index_checksum(documents, embeddings):
+            retriever = _mapped_action_index(path, meta, documents, embeddings, k)
+            if retriever is not None:
+                return retriever
+    except (OSError, ValueError, KeyError) as e:
+        print(f"⚠️ 动作索引无法加载 ({e})")
+    print("🔧 动作索引不存在或已过期，重新构建...")
+    return build_action_index(path, documents, embeddings, k=k)
+
+RAG_EMBEDDINGS = HashingEmbeddings()
+RAG_VECTOR_RETRIEVER = load_action_index(ACTION_INDEX_DIR, rag_documents, RAG_EMBEDDINGS, k=3)
+RAG_LEXICAL_RETRIEVER = LexicalRetriever.from_documents(rag_documents, k=3)
+RAG_RETRIEVER = HybridRetriever(documents=rag_documents, retrievers=[RAG_LEXICAL_RETRIEVER, RAG_VECTOR_RETRIEVER], k=3)
+
+# =======================================================
+# ========== 指令 -> 工具计划缓存 (LRU + TTL) ==========
+# =======================================================
+
+def command_cache_key(text: str) -> str:
+    """计划缓存的键：规范化后再去掉口头语"""
+    key = normalize_command(text)
+    for word in FILLER_WORDS:
+        key = key.replace(word, "")
+    return key
+
+def plan_fingerprint(tools: List, arm_device) -> str:
+    """工具列表和预设位置的指纹，任何一项变化都会使已缓存的计划失效"""
+    payload = json.dumps(
+        {"tools": sorted(t.name for t in tools), "positions": arm_device.positions},
+        sort_keys=True, ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+class PlanCache:
+    """识别文本到工具调用序列的缓存。
+
+    每个条目保存 Agent 选出的有序工具调用 [(tool_name, tool_input), ...]，
+    命中时直接按顺序重放，不再经过 RAG 和 LLM。按 LRU 淘汰并带 TTL；
+    fingerprint_fn 的返回值变化时整个缓存失效。指定 snapshot_path 时会把
+    缓存写入磁盘，重启后自动加载。
+    """
+    def __init__(self, max_size: int = 128, ttl: float = 3600.0, fingerprint_fn=None, snapshot_path: str = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fingerprint_fn = fingerprint_fn
+        self.snapshot_path = snapshot_path
+        self._entries = OrderedDict()  # key -> (写入时间戳, plan)
+        self._lock = threading.Lock()
+        self._fingerprint = fingerprint_fn() if fingerprint_fn else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        if snapshot_path:
+            self.load()
+
+    def _check_fingerprint(self):
+        if self.fingerprint_fn is None:
+            return
+        fingerprint = self.fingerprint_fn()
+        if fingerprint != self._fingerprint:
+            if self._entries:
+                print("♻️ 工具列表或预设位置已变化，计划缓存失效")
+                self.invalidations += 1
+            self._entries.clear()
+            self._fingerprint = fingerprint
+
+    def get(self, text: str):
+        key = command_cache_key(text)
+        with self._lock:
+            self._check_fingerprint()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, text: str, plan: List):
+        key = command_cache_key(text)
+        if not key or not plan:
+            return
+        with self._lock:
+            self._check_fingerprint()
+            self._entries[key] = (time.time(), [list(step) for step in plan])
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        if self.snapshot_path:
+            self.save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def save(self):
+        """写入磁盘快照 (先写临时文件再替换，避免中途退出留下损坏的文件)"""
+        with self._lock:
+            data = {"fingerprint": self._fingerprint, "entries": list(self._entries.items())}
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"⚠️ 计划缓存快照写入失败: {e}")
+
+    def load(self):
+        """加载磁盘快照，指纹不符或已过期的条目直接丢弃"""
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ 计划缓存快照读取失败: {e}")
+            return
+        if self.fingerprint_fn is not None and data.get("fingerprint") != self._fingerprint:
+            print("♻️ 计划缓存快照与当前工具/位置不一致，已忽略")
+            return
+        now = time.time()
+        with self._lock:
+            for key, (stamp, plan) in data.get("entries", []):
+                if now - stamp <= self.ttl:
+                    self._entries[key] = (stamp, plan)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        print(f"📦 已从快照加载 {len(self._entries)} 条计划缓存")
+
+# =======================================================
+# ========== Agent 运行时 (常驻 Executor + 长连接) ==========
+# =======================================================
+
+RAG_CONTEXT_PROMPT = """
     你是一个机械臂控制助手。你的任务是根据用户的指令（来自语音或文本），选择合适的工具（机械臂动作）来执行。
     
     请参考以下从RAG数据库中检索到的相关机械臂动作描述，它们包含动作名称、对应的工具ID和别名描述：
@@ -168,42 +1639,854 @@ def setup_langchain_agent(llm, tools: List, retriever: BaseRetriever):
     用户指令:
     """
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", RAG_CONTEXT_PROMPT),
-        MessagesPlaceholder("chat_history", optional=True),
-        ("human", "{input}"),
-        MessagesPlaceholder("agent_scratchpad"),
-    ])
+def create_llm(api_key: str, base_url: str = "https://api.deepseek.com", model: str = "deepseek-chat"):
+    """创建 LLM，底层使用带连接池的 keep-alive HTTP 客户端，避免每次请求重新握手 TLS"""
+    http_client = httpx.Client(
+        limits=httpx.Limits(max_connections=4, max_keepalive_connections=4, keepalive_expiry=600),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    )
+    # ChatOpenAI 会把 http_client 同时传给同步和异步客户端，而异步客户端只接受
+    # httpx.AsyncClient，因此这里显式构建两个客户端，http_client 仅供 warmup 使用
+    return ChatOpenAI(
+        model=model,
+        openai_api_key=api_key,
+        openai_api_base=base_url,
+        temperature=0,
+        client=openai.OpenAI(api_key=api_key, base_url=base_url, http_client=http_client).chat.completions,
+        async_client=openai.AsyncOpenAI(api_key=api_key, base_url=base_url).chat.completions,
+        http_client=http_client,
+    )
+
+class AgentRuntime:
+    """常驻的 Agent 运行时。
+
+    Prompt、工具 Schema 和 AgentExecutor 只在构造时创建一次，之后每条指令
+    复用同一个 Executor 和 LLM 的连接池。实例本身可调用，可直接替代原来的
+    run_agent 函数。
+    """
+    def __init__(self, llm, tools: List, retriever: BaseRetriever, matcher: IntentMatcher = None,
+                 plan_cache: PlanCache = None, corrector: PinyinCorrector = None):
+        self.llm = llm
+        self.tools = tools
+        self.tools_by_name = {t.name: t for t in tools}
+        self.retriever = retriever
+        self.matcher = matcher
+        self.plan_cache = plan_cache
+        self.corrector = corrector
+
+        prompt = ChatPromptTemplate.from_messages([
+            ("system", RAG_CONTEXT_PROMPT),
+            MessagesPlaceholder("chat_history", optional=True),
+            ("human", "{input}"),
+            MessagesPlaceholder("agent_scratchpad"),
+        ])
+        self.agent = create_openai_tools_agent(llm=llm, tools=tools, prompt=prompt)
+        # 保留中间步骤，用于提取 Agent 选择的工具调用序列写入计划缓存
+        self.agent_executor = AgentExecutor(agent=self.agent, tools=tools, verbose=True,
+                                            return_intermediate_steps=True)
+
+        # LLM 路径的延迟记录 (秒)，第一条用于统计首条指令延迟
+        self.latencies: List[float] = []
 
-    agent = create_openai_tools_agent(llm=llm, tools=tools, prompt=prompt)
+    def warmup(self) -> bool:
+        """启动时预先建立到 LLM 服务的 TLS 连接，放入连接池供后续请求复用"""
+        http_client = getattr(self.llm, "http_client", None)
+        if http_client is None:
+            return False
+        t0 = time.perf_counter()
+        try:
+            http_client.get(
+                f"{self.llm.openai_api_base.rstrip('/')}/models",
+                headers={"Authorization": f"Bearer {self.llm.openai_api_key}"},
+            )
+        except Exception as e:
+            print(f"⚠️ LLM 连接预热失败: {e}")
+            return False
+        print(f"🔥 LLM 连接已预热 ({(time.perf_counter() - t0) * 1000:.0f}ms)")
+        return True
+
+    def _correct(self, input_text: str) -> str:
+        """解析前先纠正识别文本中的同音字/近音字"""
+        if self.corrector is None:
+            return input_text
+        t0 = time.perf_counter()
+        corrected = self.corrector.correct(input_text)
+        if corrected != normalize_command(input_text):
+            print(f"\n🔤 拼音纠错: '{input_text}' -> '{corrected}' (耗时 {(time.perf_counter() - t0) * 1e6:.0f}µs)")
+            return corrected
+        return input_text
+
+    def _local_plan(self, input_text: str):
+        """不经过 LLM 的本地解析：快速通道匹配或计划缓存命中，均未命中时返回 None"""
+        # 0. 本地快速通道：指令唯一命中某个动作时直接调用工具，跳过 RAG 与 LLM
+        if self.matcher is not None:
+            t0 = time.perf_counter()
+            matched_tool = self.matcher.match(input_text)
+            if matched_tool is not None:
+                print(f"\n⚡ 快速通道命中: '{input_text}' -> {matched_tool.name} (匹配耗时 {(time.perf_counter() - t0) * 1e6:.0f}µs)")
+                return [(matched_tool.name, {})]
+
+        # 1. 计划缓存：重复指令直接重放上次 Agent 选出的工具调用序列
+        if self.plan_cache is not None:
+            plan = self.plan_cache.get(input_text)
+            if plan is not None:
+                print(f"\n📦 计划缓存命中: '{input_text}' -> {[name for name, _ in plan]}")
+                return plan
+        return None
+
+    def _rag_context(self, input_text: str) -> str:
+        retrieved_docs = self.retriever.invoke(input_text)
+        return "\n".join([f"- 动作名: {doc.metadata['action_name']}, 对应ID: {doc.metadata['tool_name']}, 描述: {doc.page_content}" for doc in retrieved_docs])
+
+    def run(self, input_text: str):
+        input_text = self._correct(input_text)
+        plan = self._local_plan(input_text)
+        if plan is not None:
+            return self.execute_plan(plan)
 
-    # 返回一个可调用的函数，用于执行 Agent
-    def run_agent(input_text: str):
         print(f"\n🧠 Agent 正在处理指令: '{input_text}'...")
-        # 1. 执行 RAG 检索
-        retrieved_docs = retriever.invoke(input_text)
-        context = "\n".join([f"- 动作名: {doc.metadata['action_name']}, 对应ID: {doc.metadata['tool_name']}, 描述: {doc.page_content}" for doc in retrieved_docs])
+        t0 = time.perf_counter()
+        # 2. 执行 RAG 检索
+        context = self._rag_context(input_text)
         
-        # 2. 调用 Agent Executor
-        agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+        # 3. 调用常驻的 Agent Executor
         try:
-            result = agent_executor.invoke({"input": input_text, "context": context})
+            result = self.agent_executor.invoke({"input": input_text, "context": context})
             print(f"🤖 Agent 最终响应: {result['output']}")
+            if self.plan_cache is not None:
+                # AgentExecutor 也会记录无效的工具调用 (例如 RAG 中有但未实现的 action_move_up)，不能写入缓存
+                self.plan_cache.put(input_text, [(action.tool, action.tool_input) for action, _ in result["intermediate_steps"]
+                                                 if action.tool in self.tools_by_name])
             return result
         except Exception as e:
             print(f"🚨 Agent 执行失败: {e}")
             return {"output": "抱歉，执行机械臂动作时发生错误。"}
+        finally:
+            self.latencies.append(time.perf_counter() - t0)
+            print(f"⏱️ Agent 耗时: {self.latencies[-1]:.2f}s")
+
+    __call__ = run
+
+    def interpret(self, input_text: str) -> List:
+        """只解析不执行，返回工具调用序列 [(tool_name, tool_input), ...]。
+
+        本地未命中时只让 LLM 规划一轮工具调用 (不把工具结果回传给 LLM)，
+        这样解析和机械臂执行可以放在不同的线程上流水进行。
+        """
+        input_text = self._correct(input_text)
+        plan = self._local_plan(input_text)
+        if plan is not None:
+            return plan
+
+        print(f"\n🧠 Agent 正在解析指令: '{input_text}'...")
+        t0 = time.perf_counter()
+        try:
+            decision = self.agent.invoke({
+                "input": input_text,
+                "context": self._rag_context(input_text),
+                "intermediate_steps": [],
+            })
+        except Exception as e:
+            print(f"🚨 Agent 解析失败: {e}")
+            return []
+        finally:
+            self.latencies.append(time.perf_counter() - t0)
+            print(f"⏱️ Agent 耗时: {self.latencies[-1]:.2f}s")
+
+        if isinstance(decision, AgentFinish):
+            print(f"🤖 Agent 最终响应: {decision.return_values.get('output')}")
+            return []
+        plan = [(action.tool, action.tool_input) for action in decision if action.tool in self.tools_by_name]
+        if self.plan_cache is not None:
+            self.plan_cache.put(input_text, plan)
+        return plan
+
+    def execute_plan(self, plan: List, cancelled=None):
+        """按顺序重放工具调用序列；cancelled() 返回 True 时不再调用后续工具"""
+        output = None
+        for tool_name, tool_input in plan:
+            if cancelled is not None and cancelled():
+                break
+            if tool_name not in self.tools_by_name:
+                print(f"⚠️ 计划中的工具 {tool_name} 不存在，已跳过")
+                continue
+            output = self.tools_by_name[tool_name].invoke(tool_input)
+        return {"output": output}
+
+    def latency_report(self) -> Dict[str, Any]:
+        """返回首条指令延迟和稳态 (其后各条的中位数) 延迟，单位秒"""
+        steady = sorted(self.latencies[1:])
+        return {
+            "count": len(self.latencies),
+            "first": self.latencies[0] if self.latencies else None,
+            "steady_median": steady[len(steady) // 2] if steady else None,
+        }
+
+# Agent 执行函数
+def setup_langchain_agent(llm, tools: List, retriever: BaseRetriever, matcher: IntentMatcher = None,
+                          plan_cache: PlanCache = None, corrector: PinyinCorrector = None):
+    """设置 LangChain Agent，返回可直接调用的 AgentRuntime"""
+    return AgentRuntime(llm, tools, retriever, matcher, plan_cache, corrector)
+
+# =======================================================
+# ========== 指令流水线 (识别 -> 解析 -> 执行) ==========
+# =======================================================
+
+class CommandPipeline:
+    """recognize → interpret → execute 三级指令流水线。
+
+    submit() 由 ASR 回调线程调用，只做入队，永远不会阻塞 WebSocket 线程。
+    解析 (本地匹配 / 缓存 / LLM) 和执行 (机械臂动作) 各自在专用线程上运行，
+    级间使用有界队列：
 
-    return run_agent
+    - 识别 -> 解析: merge_window 秒内重复提交、且仍在队尾未处理的相同指令视为
+      ASR 重发直接合并 (间隔更久的重复指令是有意的，例如说两次"分拣黄色"
+      就是两件物品)；队列满时按 overflow 策略丢弃
+      ("drop_oldest" 丢弃最早的未处理指令，"drop_newest" 丢弃新指令)。
+    - 解析 -> 执行: 队列满时解析线程阻塞等待 (背压)，LLM 不会领先机械臂太多。
+
+    停止指令 (见 is_stop_command) 在 submit() 中直接处理，不进入任何队列：
+    清空两级队列、作废正在解析的指令，并调用 executor.stop() 急停机械臂。
+    """
+    def __init__(self, runtime: AgentRuntime, executor: MotionExecutor = None, recognize_size: int = 4,
+                 execute_size: int = 2, overflow: str = "drop_oldest", merge_window: float = 1.0):
+        if overflow not in ("drop_oldest", "drop_newest"):
+            raise ValueError(f"未知的溢出策略: {overflow}")
+        self.runtime = runtime
+        self.executor = executor
+        self.overflow = overflow
+        self.merge_window = merge_window
+        self._last_submit = (None, 0.0)  # (指令, 提交时间)
+        self.recognized = queue.Queue(maxsize=recognize_size)
+        self.planned = queue.Queue(maxsize=execute_size)
+        self.is_running = False
+        self._workers: List[threading.Thread] = []
+        # 每次急停加一，急停之前取出的指令解析完成后直接丢弃
+        self._epoch = 0
+        self.counters = {"submitted": 0, "merged": 0, "dropped": 0, "interpreted": 0, "executed": 0, "halted": 0}
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        self._workers = [
+            threading.Thread(target=self._interpret_worker, name="interpret", daemon=True),
+            threading.Thread(target=self._execute_worker, name="execute", daemon=True),
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def stop(self, timeout: float = 2.0):
+        self.is_running = False
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def submit(self, text: str) -> bool:
+        """提交一条识别结果，返回是否被接受 (合并也视为接受)"""
+        requested_at = time.perf_counter()
+        self.counters["submitted"] += 1
+        if is_stop_command(text):
+            self.halt(requested_at)
+            return True
+        with self.recognized.mutex:
+            last_text, last_time = self._last_submit
+            self._last_submit = (text, requested_at)
+            if (self.recognized.queue and self.recognized.queue[-1] == text
+                    and last_text == text and requested_at - last_time <= self.merge_window):
+                self.counters["merged"] += 1
+                return True
+        try:
+            self.recognized.put_nowait(text)
+            return True
+        except queue.Full:
+            pass
+        self.counters["dropped"] += 1
+        if self.overflow == "drop_newest":
+            print(f"⚠️ 指令队列已满，丢弃新指令: '{text}'")
+            return False
+        try:
+            dropped = self.recognized.get_nowait()
+            print(f"⚠️ 指令队列已满，丢弃最早的指令: '{dropped}'")
+        except queue.Empty:
+            pass
+        try:
+            self.recognized.put_nowait(text)
+        except queue.Full:
+            return False
+        return True
+
+    def halt(self, requested_at: float = None) -> Future:
+        """急停：丢弃所有待解析和待执行的指令，机械臂保持当前姿态"""
+        self._epoch += 1
+        self.counters["halted"] += 1
+        for q in (self.recognized, self.planned):
+            with q.mutex:
+                q.queue.clear()
+                q.not_full.notify_all()
+        print("🛑 收到停止指令，取消所有待执行动作")
+        if self.executor is not None:
+            return self.executor.stop(requested_at)
+
+    def _interpret_worker(self):
+        while self.is_running:
+            try:
+                text = self.recognized.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            epoch = self._epoch
+            try:
+                plan = self.runtime.interpret(text)
+            except Exception as e:
+                print(f"🚨 指令解析出错: {e}")
+                continue
+            self.counters["interpreted"] += 1
+            if not plan or epoch != self._epoch:
+                continue
+            # 执行队列满时在此等待，对解析阶段形成背压
+            while self.is_running and epoch == self._epoch:
+                try:
+                    self.planned.put((epoch, plan), timeout=0.2)
+                    break
+                except queue.Full:
+                    continue
+
+    def _execute_worker(self):
+        while self.is_running:
+            try:
+                epoch, plan = self.planned.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if epoch != self._epoch:
+                continue
+            try:
+                # 工具只把动作排入 MOTION_EXECUTOR，这里不等待机械臂运动完成
+                result = self.runtime.execute_plan(plan, cancelled=lambda: epoch != self._epoch)
+                print(f"🤖 动作已下发: {result['output']}")
+            except Exception as e:
+                print(f"🚨 动作执行出错: {e}")
+            self.counters["executed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.counters, recognize_depth=self.recognized.qsize(), execute_depth=self.planned.qsize())
 
 # =======================================================
 # ========== 讯飞语音识别模块 (集成) ==========
 # =======================================================
 
+class Ws_Param:
+    """讯飞 IAT 接口参数与鉴权 URL 生成"""
+    def __init__(self, APPID, APIKey, APISecret):
+        self.APPID = APPID
+        self.APIKey = APIKey
+        self.APISecret = APISecret
+        self.CommonArgs = {"app_id": self.APPID}
+        self.BusinessArgs = {
+            "domain": "iat",
+            "language": "zh_cn",
+            "accent": "mandarin",
+            "vinfo": 1,
+            "vad_eos": 1000
+        }
+
+    def create_url(self):
+        url = 'wss://ws-api.xfyun.cn/v2/iat'
+        now = datetime.now()
+        date = format_date_time(mktime(now.timetuple()))
+        
+        signature_origin = f"host: ws-api.xfyun.cn\ndate: {date}\nGET /v2/iat HTTP/1.1"
+        
+        signature_sha = hmac.new(
+            self.APISecret.encode('utf-8'),
+            signature_origin.encode('utf-8'),
+            digestmod=hashlib.sha256
+        ).digest()
+        signature_sha = base64.b64encode(signature_sha).decode(encoding='utf-8')
+        
+        authorization_origin = f'api_key="{self.APIKey}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha}"'
+        authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
+        
+        v = {
+            "authorization": authorization,
+            "date": date,
+            "host": "ws-api.xfyun.cn"
+        }
+        return url + '?' + urlencode(v)
+
+class FrameEncoder:
+    """IAT 音频帧编码器。
+
+    JSON 帧的前缀和后缀在构造时按状态预先序列化好，编码时只做一次 base64，
+    并把前缀、音频、后缀拷贝进一块复用的缓冲区，不再为每帧构建嵌套 dict
+    和调用 json.dumps。base64 结果仍是一个临时 bytes 对象 (标准库不能直接
+    编码进已有缓冲区)，除此之外每帧不再分配与音频长度相关的内存。frame() 返回指向内部缓冲区的 memoryview，下一次调用
+    前有效，可直接交给 ws.send。支持把多个音频块合并成一帧 (链路变慢时使用)。
+    """
+    AUDIO_FORMAT = "audio/L16;rate=16000"
+
+    def __init__(self, common_args: Dict, business_args: Dict, chunk_bytes: int = 1040, max_coalesce: int = 4):
+        self.max_coalesce = max_coalesce
+        placeholder = "\x00"
+        self._prefixes = {}
+        for status in (0, 1, 2):
+            d = {"data": {"status": status, "format": self.AUDIO_FORMAT, "encoding": "raw", "audio": placeholder}}
+            if status == 0:
+                d = {"common": common_args, "business": business_args, **d}
+            prefix, suffix = json.dumps(d, ensure_ascii=False, separators=(",", ":")).split(json.dumps(placeholder)[1:-1])
+            self._prefixes[status] = prefix.encode("utf-8")
+            self._suffix = suffix.encode("utf-8")
+        pcm_capacity = chunk_bytes * max_coalesce
+        self._pcm = bytearray(pcm_capacity)
+        self._frame = bytearray(max(map(len, self._prefixes.values())) + (pcm_capacity + 2) // 3 * 4 + len(self._suffix))
+        self._pcm_view = memoryview(self._pcm)
+        self._frame_view = memoryview(self._frame)
+
+    def frame(self, status: int, chunks: List = ()) -> memoryview:
+        """把若干音频块编码成一帧 JSON (status: 0 第一帧, 1 中间帧, 2 最后一帧)"""
+        if len(chunks) == 1:
+            pcm = chunks[0]
+        else:
+            size = sum(len(chunk) for chunk in chunks)
+            if size > len(self._pcm):
+                self._pcm = bytearray(size)
+                self._pcm_view = memoryview(self._pcm)
+            # 通过 memoryview 写入：bytearray 的切片赋值会先把非 bytearray 的源数据整体复制一份
+            size = 0
+            for chunk in chunks:
+                self._pcm_view[size:size + len(chunk)] = chunk
+                size += len(chunk)
+            pcm = self._pcm_view[:size]
+        # 标准库没有把 base64 直接写进已有缓冲区的接口 (NumPy 查表实现要慢数倍)，
+        # 这里的 bytes 是每帧唯一一次与音频长度相关的临时分配
+        audio = binascii.b2a_base64(pcm, newline=False) if len(pcm) else b""
+        prefix = self._prefixes[status]
+        end = len(prefix) + len(audio) + len(self._suffix)
+        if end > len(self._frame):
+            # 上一帧的 memoryview 可能仍被引用，扩容时换一块新缓冲区而不是原地 resize
+            self._frame = bytearray(end)
+            self._frame_view = memoryview(self._frame)
+        frame = self._frame_view
+        pos = len(prefix)
+        frame[:pos] = prefix
+        frame[pos:pos + len(audio)] = audio
+        pos += len(audio)
+        frame[pos:end] = self._suffix
+        return frame[:end]
+
+class AudioRingBuffer:
+    """单生产者/单消费者的预分配音频环形缓冲区。
+
+    PortAudio 回调线程只写 head，消费线程只写 tail，两者都是单调递增的计数，
+    无需加锁。read() 返回指向槽位的 memoryview，不做拷贝；最近 reserve 个
+    已读槽位不会被覆盖，因此调用方可以持有最近 reserve 块的视图 (用于预录和
+    合并发送)，更久的数据需要自行拷贝。缓冲区满时丢弃新数据并计入 overruns。
+    """
+    def __init__(self, slots: int, chunk_bytes: int, reserve: int = 16):
+        if slots <= reserve:
+            raise ValueError("slots 必须大于 reserve")
+        self.slots = slots
+        self.chunk_bytes = chunk_bytes
+        self.reserve = reserve
+        self._data = bytearray(slots * chunk_bytes)
+        self._views = [memoryview(self._data)[i * chunk_bytes:(i + 1) * chunk_bytes] for i in range(slots)]
+        self._head = 0  # 已写入的块数 (仅生产者修改)
+        self._tail = 0  # 已读取的块数 (仅消费者修改)
+        self._ready = threading.Event()
+        self.overruns = 0     # 缓冲区满被丢弃的块数
+        self.underruns = 0    # 消费者读取时缓冲区为空的次数
+        self.high_water = 0   # 积压块数的历史最大值
+        self.device_overflows = 0  # PortAudio 报告的输入溢出次数
+
+    def write(self, data: bytes):
+        """生产者 (音频回调) 写入一块"""
+        head = self._head
+        if head - self._tail >= self.slots - self.reserve:
+            self.overruns += 1
+        else:
+            self._views[head % self.slots][:len(data)] = data
+            self._head = head + 1
+            backlog = head + 1 - self._tail
+            if backlog > self.high_water:
+                self.high_water = backlog
+        self._ready.set()
+
+    def read(self, timeout: float = 1.0):
+        """消费者读取一块，超时返回 None"""
+        while self._head == self._tail:
+            self.underruns += 1
+            self._ready.clear()
+            if self._head != self._tail:
+                break
+            if not self._ready.wait(timeout):
+                return None
+        view = self._views[self._tail % self.slots]
+        self._tail += 1
+        return view
+
+    def backlog(self) -> int:
+        return self._head - self._tail
+
+    def flush(self):
+        self._tail = self._head
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backlog": self.backlog(),
+            "high_water": self.high_water,
+            "overruns": self.overruns,
+            "underruns": self.underruns,
+            "device_overflows": self.device_overflows,
+        }
+
+class AudioInput:
+    """常驻的麦克风输入：PyAudio 以回调模式运行，音频写入预分配的环形缓冲区。
+
+    发送变慢或 GIL 被占用时音频先在缓冲区里积压而不是被静默丢弃；真正溢出时
+    会计数并在日志中提示。
+    """
+    def __init__(self, rate: int = 16000, chunk: int = 520, channels: int = 1, buffer_seconds: float = 4.0):
+        self.rate = rate
+        self.chunk = chunk
+        self.channels = channels
+        self.ring = AudioRingBuffer(
+            slots=max(32, int(buffer_seconds * rate / chunk)),
+            chunk_bytes=chunk * channels * 2,
+        )
+        self._pa = None
+        self._stream = None
+        self._reported_overruns = 0
+
+    @property
+    def is_open(self) -> bool:
+        return self._stream is not None
+
+    def _callback(self, in_data, frame_count, time_info, status_flags):
+        if status_flags & pyaudio.paInputOverflow:
+            self.ring.device_overflows += 1
+        self.ring.write(in_data)
+        return None, pyaudio.paContinue
+
+    def open(self):
+        if self._stream is not None:
+            return
+        self._pa = pyaudio.PyAudio()
+        try:
+            self._stream = self._pa.open(
+                format=pyaudio.paInt16,
+                channels=self.channels,
+                rate=self.rate,
+                input=True,
+                frames_per_buffer=self.chunk,
+                stream_callback=self._callback,
+            )
+        except Exception:
+            self._pa.terminate()
+            self._pa = None
+            raise
+        self._stream.start_stream()
+        print("🔊 麦克风已打开 (常驻, 回调模式)")
+
+    def flush(self):
+        """丢弃两次识别之间积压在缓冲区里的旧音频"""
+        self.ring.flush()
+
+    def read(self):
+        """读取一块音频 (memoryview，最近 ring.reserve 块内有效)"""
+        buf = self.ring.read(timeout=1.0)
+        if buf is None:
+            raise IOError("麦克风超过 1s 没有数据")
+        if self.ring.overruns != self._reported_overruns:
+            print(f"⚠️ 音频缓冲区溢出，已丢弃 {self.ring.overruns - self._reported_overruns} 块 (累计 {self.ring.overruns})")
+            self._reported_overruns = self.ring.overruns
+        return buf
+
+    def backlog(self) -> int:
+        """缓冲区中尚未读取的块数"""
+        return self.ring.backlog()
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.stop_stream()
+            self._stream.close()
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
+
+class ASRSession:
+    """讯飞 IAT 会话管理器。
+
+    后台线程在签名过期前重新生成鉴权 URL，并在需要时保持一条已完成握手的备用
+    WebSocket：连续监听开启期间 (set_active(True))，以及每次 acquire() 之后的
+    linger 秒内。其余时间不建连，语音功能不用时不会每隔几秒连一次讯飞。
+    讯飞会断开长时间不发数据的连接，因此备用连接空闲超过 standby_max_idle 秒
+    后会被替换。建连失败按指数退避重试 (最长 max_backoff 秒)，连续失败只打印
+    一次警告。acquire() 直接取走备用连接，新的一句话几乎无需等待建连即可开始
+    上传音频。
+    """
+    def __init__(self, ws_param: Ws_Param, url_ttl: float = 240.0, standby_max_idle: float = 8.0,
+                 linger: float = 30.0, max_backoff: float = 60.0):
+        self.ws_param = ws_param
+        self.url_ttl = url_ttl  # 讯飞要求 date 与服务器时间相差不超过 300s
+        self.standby_max_idle = standby_max_idle
+        self.linger = linger
+        self.max_backoff = max_backoff
+        self._active = False
+        self._warm_until = 0.0
+        self._backoff = 0.0  # 当前退避时长 (秒)，0 表示上次建连成功
+        self._next_attempt = 0.0
+        self._url = None
+        self._url_time = 0.0
+        self._standby = None
+        self._standby_time = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self.is_running = False
+
+    def start(self):
+        if self.is_running:
+            return
+        self.is_running = True
+        threading.Thread(target=self._keeper, name="asr-session", daemon=True).start()
+
+    def set_active(self, active: bool):
+        """连续监听开启时保持备用连接；关闭后再保留 linger 秒"""
+        self._active = active
+        self._warm_until = time.time() + self.linger
+        self._wakeup.set()
+
+    def _wanted(self) -> bool:
+        return self._active or time.time() < self._warm_until
+
+    def stop(self):
+        self.is_running = False
+        self._wakeup.set()
+        with self._lock:
+            standby, self._standby = self._standby, None
+        if standby is not None:
+            standby.close()
+
+    def _signed_url(self) -> str:
+        if self._url is None or time.time() - self._url_time > self.url_ttl:
+            self._url = self.ws_param.create_url()
+            self._url_time = time.time()
+        return self._url
+
+    def _connect(self):
+        return websocket.create_connection(
+            self._signed_url(),
+            sslopt={"cert_reqs": ssl.CERT_NONE},
+            enable_multithread=True,
+        )
+
+    def acquire(self):
+        """取走备用连接 (必要时当场建连)，并通知后台准备下一条"""
+        with self._lock:
+            ws, self._standby = self._standby, None
+            fresh = ws is not None and ws.connected and time.time() - self._standby_time < self.standby_max_idle
+        self._warm_until = time.time() + self.linger
+        self._wakeup.set()
+        if fresh:
+            return ws
+        if ws is not None:
+            ws.close()
+        return self._connect()
+
+    def _keeper(self):
+        while self.is_running:
+            wanted = self._wanted()
+            with self._lock:
+                stale = self._standby is not None and (
+                    not wanted or not self._standby.connected
+                    or time.time() - self._standby_time >= self.standby_max_idle)
+                if stale:
+                    self._standby.close()
+                    self._standby = None
+                need_standby = wanted and self._standby is None and time.time() >= self._next_attempt
+            if need_standby:
+                if time.time() - self._url_time > self.url_ttl * 0.8:
+                    self._url = None  # 提前重签，避免临近过期时建连被拒
+                try:
+                    ws = self._connect()
+                except Exception as e:
+                    if not self._backoff:
+                        print(f"⚠️ 备用语音连接建立失败，将退避重试: {e}")
+                    self._backoff = min(self.max_backoff, self._backoff * 2 or 1.0)
+                    self._next_attempt = time.time() + self._backoff
+                    ws = None
+                else:
+                    if self._backoff:
+                        print("✅ 备用语音连接已恢复")
+                    self._backoff = 0.0
+                if ws is not None:
+                    with self._lock:
+                        if self.is_running and self._standby is None:
+                            self._standby, self._standby_time = ws, time.time()
+                            ws = None
+                    if ws is not None:
+                        ws.close()
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+
+class Endpointer:
+    """流式端点检测：按块计算短时能量 (RMS) 和过零率，判断一句话何时结束。
+
+    能量阈值随背景噪声自适应；能量稍低但过零率高的块 (清辅音) 也算作语音。
+    检测到语音后，连续静音超过 hangover_ms 即认为这句话结束。
+    """
+    def __init__(self, rate: int = 16000, energy_threshold: float = 400.0, noise_ratio: float = 3.0,
+                 zcr_unvoiced: float = 0.25, hangover_ms: float = 600.0, min_speech_ms: float = 120.0):
+        self.rate = rate
+        self.energy_threshold = energy_threshold
+        self.noise_ratio = noise_ratio
+        self.zcr_unvoiced = zcr_unvoiced
+        self.hangover_ms = hangover_ms
+        self.min_speech_ms = min_speech_ms
+        self.noise_floor = energy_threshold / noise_ratio
+        self.reset()
+
+    def reset(self):
+        self.speech_ms = 0.0
+        self.silence_ms = 0.0
+        self.speech_end_time = None  # 最后一个语音块的时间 (time.monotonic)
+
+    @property
+    def in_speech(self) -> bool:
+        return self.speech_ms >= self.min_speech_ms
+
+    @property
+    def ended(self) -> bool:
+        return self.in_speech and self.silence_ms >= self.hangover_ms
+
+    def is_speech(self, buf) -> bool:
+        """判断一个 16bit PCM 块是否为语音，并据此更新噪声基线"""
+        x = np.frombuffer(buf, dtype=np.int16).astype(np.float32)
+        if x.size < 2:
+            return False
+        rms = float(np.sqrt(np.dot(x, x) / x.size))
+        zcr = np.count_nonzero(np.signbit(x[1:]) != np.signbit(x[:-1])) / (x.size - 1)
+        threshold = max(self.energy_threshold, self.noise_floor * self.noise_ratio)
+        speech = rms > threshold or (rms > 0.5 * threshold and zcr > self.zcr_unvoiced)
+        if not speech:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * rms
+        return speech
+
+    def update(self, buf) -> bool:
+        """送入一块音频，返回这句话是否已经结束"""
+        chunk_ms = 1000.0 * (len(buf) // 2) / self.rate
+        if self.is_speech(buf):
+            self.speech_ms += chunk_ms
+            self.silence_ms = 0.0
+            self.speech_end_time = time.monotonic()
+        elif self.speech_ms > 0:
+            self.silence_ms += chunk_ms
+            if not self.in_speech and self.silence_ms >= self.hangover_ms:
+                self.speech_ms = 0.0  # 过短的噪声脉冲，不算开始说话
+        return self.ended
+
+def load_wav(path: str) -> np.ndarray:
+    """读取 16bit 单声道 WAV 文件为 int16 数组"""
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getnchannels() != 1:
+            raise ValueError(f"仅支持 16bit 单声道 WAV: {path}")
+        return np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+
+def _mel_filterbank(rate: int, n_fft: int, n_mels: int, fmin: float = 20.0) -> np.ndarray:
+    """三角 mel 滤波器组，形状 (n_mels, n_fft // 2 + 1)"""
+    to_mel = lambda f: 2595.0 * np.log10(1.0 + f / 700.0)
+    to_hz = lambda m: 700.0 * (10.0 ** (m / 2595.0) - 1.0)
+    points = to_hz(np.linspace(to_mel(fmin), to_mel(rate / 2), n_mels + 2))
+    bins = np.floor((n_fft + 1) * points / rate).astype(int)
+    bank = np.zeros((n_mels, n_fft // 2 + 1), dtype=np.float32)
+    for m in range(1, n_mels + 1):
+        left, center, right = bins[m - 1], bins[m], bins[m + 1]
+        if center > left:
+            bank[m - 1, left:center] = (np.arange(left, center) - left) / (center - left)
+        if right > center:
+            bank[m - 1, center:right] = (right - np.arange(center, right)) / (right - center)
+    return bank
+
+class WakeWordDetector:
+    """本地唤醒词检测：log-mel 特征 + DTW 模板匹配，只依赖 NumPy。
+
+    用几段唤醒词录音注册模板；detect() 对 VAD 切出的语音段提取特征，
+    与每个模板做 DTW，最小的归一化距离低于 threshold 即判定为唤醒。
+    只在本地语音段上计算，树莓派单核即可实时运行。
+    """
+    def __init__(self, rate: int = 16000, n_fft: int = 512, hop: int = 320, n_mels: int = 24,
+                 threshold: float = 5.0, band: float = 0.3):
+        self.rate = rate
+        self.n_fft = n_fft
+        self.hop = hop
+        self.threshold = threshold
+        self.band = band  # Sakoe-Chiba 约束带宽 (占序列长度的比例)
+        self._window = np.hanning(n_fft).astype(np.float32)
+        self._mel = _mel_filterbank(rate, n_fft, n_mels)
+        self.templates: List[np.ndarray] = []
+
+    @classmethod
+    def from_dir(cls, path: str, **kwargs) -> "WakeWordDetector":
+        """用目录下所有 .wav 录音注册唤醒词模板"""
+        detector = cls(**kwargs)
+        for name in sorted(os.listdir(path)):
+            if name.lower().endswith(".wav"):
+                detector.enroll(load_wav(os.path.join(path, name)))
+        print(f"🔔 已注册 {len(detector.templates)} 个唤醒词模板")
+        return detector
+
+    def features(self, pcm: np.ndarray) -> np.ndarray:
+        """提取去除首尾静音、做过均值归一化的 log-mel 特征，形状 (帧数, n_mels)"""
+        x = np.asarray(pcm, dtype=np.float32) / 32768.0
+        if x.size < self.n_fft:
+            return np.zeros((0, self._mel.shape[0]), dtype=np.float32)
+        n_frames = 1 + (x.size - self.n_fft) // self.hop
+        index = np.arange(self.n_fft)[None, :] + self.hop * np.arange(n_frames)[:, None]
+        power = np.abs(np.fft.rfft(x[index] * self._window, axis=1)) ** 2
+        logmel = np.log(power @ self._mel.T + 1e-8)
+        # 去掉能量比峰值低约 15dB 以上的首尾帧 (logmel 是自然对数功率: 3.5 * 10 * log10(e) ≈ 15.2dB)
+        energy = logmel.mean(axis=1)
+        active = np.flatnonzero(energy > energy.max() - 3.5)
+        logmel = logmel[active[0]:active[-1] + 1]
+        return logmel - logmel.mean(axis=0)
+
+    def enroll(self, pcm: np.ndarray):
+        feats = self.features(pcm)
+        if len(feats):
+            self.templates.append(feats)
+
+    def _dtw(self, a: np.ndarray, b: np.ndarray) -> float:
+        n, m = len(a), len(b)
+        cost = np.sqrt(((a[:, None, :] - b[None, :, :]) ** 2).sum(axis=2))
+        width = max(int(self.band * max(n, m)), abs(n - m) + 1)
+        acc = np.full((n + 1, m + 1), np.inf)
+        acc[0, 0] = 0.0
+        for i in range(1, n + 1):
+            center = i * m // n
+            lo, hi = max(1, center - width), min(m, center + width)
+            row, prev = acc[i], acc[i - 1]
+            # 先用上一行向量化求出 min(上, 左上)，再顺序处理同一行内的左侧依赖
+            best = np.minimum(prev[lo:hi + 1], prev[lo - 1:hi]) + cost[i - 1, lo - 1:hi]
+            for j in range(lo, hi + 1):
+                row[j] = min(best[j - lo], row[j - 1] + cost[i - 1, j - 1])
+        return acc[n, m] / (n + m)
+
+    def distance(self, pcm: np.ndarray) -> float:
+        """语音段到最近模板的归一化 DTW 距离"""
+        feats = self.features(pcm)
+        best = float("inf")
+        for template in self.templates:
+            # 时长相差两倍以上的片段不可能是唤醒词
+            if len(feats) == 0 or not 0.5 <= len(feats) / len(template) <= 2.0:
+                continue
+            best = min(best, self._dtw(feats, template))
+        return best
+
+    def detect(self, pcm: np.ndarray) -> bool:
+        return self.distance(pcm) < self.threshold
+
 class ASRClient:
     """集成语音识别和 Agent 逻辑的客户端"""
     
-    def __init__(self, run_agent_func):
+    def __init__(self, run_agent_func, hangover_ms: float = 600.0, wake_word: WakeWordDetector = None):
         self.run_agent_func = run_agent_func
         
         # 语音识别参数
@@ -217,132 +2500,259 @@ class ASRClient:
         self.APPID = '45099785'
         self.APIKey = ''
         self.APISecret = ''
-        self.ws_param = self._get_ws_param()
-
-    def _get_ws_param(self):
-        """生成讯飞 WebSocket 连接参数"""
-        class Ws_Param_Internal:
-            def __init__(self, APPID, APIKey, APISecret):
-                self.APPID = APPID
-                self.APIKey = APIKey
-                self.APISecret = APISecret
-                self.CommonArgs = {"app_id": self.APPID}
-                self.BusinessArgs = {
-                    "domain": "iat",
-                    "language": "zh_cn",
-                    "accent": "mandarin",
-                    "vinfo": 1,
-                    "vad_eos": 1000
-                }
-
-            def create_url(self):
-                url = 'wss://ws-api.xfyun.cn/v2/iat'
-                now = datetime.now()
-                date = format_date_time(mktime(now.timetuple()))
-                
-                signature_origin = f"host: ws-api.xfyun.cn\ndate: {date}\nGET /v2/iat HTTP/1.1"
-                
-                signature_sha = hmac.new(
-                    self.APISecret.encode('utf-8'),
-                    signature_origin.encode('utf-8'),
-                    digestmod=hashlib.sha256
-                ).digest()
-                signature_sha = base64.b64encode(signature_sha).decode(encoding='utf-8')
-                
-                authorization_origin = f'api_key="{self.APIKey}", algorithm="hmac-sha256", headers="host date request-line", signature="{signature_sha}"'
-                authorization = base64.b64encode(authorization_origin.encode('utf-8')).decode(encoding='utf-8')
-                
-                v = {
-                    "authorization": authorization,
-                    "date": date,
-                    "host": "ws-api.xfyun.cn"
-                }
-                return url + '?' + urlencode(v)
-        return Ws_Param_Internal(self.APPID, self.APIKey, self.APISecret)
-
-    def on_open(self, ws):
-        """WebSocket连接建立时的处理"""
-        def run(*args):
-            status = self.STATUS_FIRST_FRAME
-            
-            CHUNK = 520
-            FORMAT = pyaudio.paInt16
-            CHANNELS = 1
-            RATE = 16000
-            
-            p = None
-            stream = None
-            try:
-                p = pyaudio.PyAudio()
-                # 尝试使用默认设备
-                stream = p.open(
-                    format=FORMAT,
-                    channels=CHANNELS,
-                    rate=RATE,
-                    input=True,
-                    frames_per_buffer=CHUNK,
-                    exception_on_overflow=False # 容忍缓冲区溢出
-                )
-                print("🔊 麦克风已打开，开始录音...")
-                self.is_listening = True
+        self.ws_param = Ws_Param(self.APPID, self.APIKey, self.APISecret)
+        self.encoder = FrameEncoder(self.ws_param.CommonArgs, self.ws_param.BusinessArgs)
+
+        # 常驻麦克风与会话 (预签名 URL + 备用 WebSocket)
+        self.audio = AudioInput()
+        self.session = ASRSession(self.ws_param)
+
+        # 本地端点检测与最终结果事件
+        self.endpointer = Endpointer(rate=self.audio.rate, hangover_ms=hangover_ms)
+        self.max_utterance_s = 10
+        self.result_timeout = 3.0
+        self._final_result = threading.Event()
+        self._speech_end_time = None
+        # 说话结束 -> 收到最终识别结果的延迟 (秒)
+        self.final_latencies: List[float] = []
+
+        # 连续监听模式 (VAD 门控上传)
+        self.continuous = False
+        self._continuous_thread = None
+        self.pre_roll_ms = 300
+        self.audio_stats = {"chunks_captured": 0, "chunks_uploaded": 0, "frames_sent": 0, "utterances": 0}
+
+        # 唤醒词：设置后连续监听模式只有在唤醒后的 wake_timeout_s 秒内才会上传一句指令
+        self.wake_word = wake_word
+        self.wake_timeout_s = 8.0
+        self.max_wake_s = 2.5
+        self._awake_until = 0.0
+
+    def prepare(self):
+        """启动时打开麦克风并启动会话管理线程 (备用连接只在连续监听期间和 start 之后保持)"""
+        try:
+            self.audio.open()
+        except Exception as e:
+            print(f"⚠️ 麦克风打开失败: {e}")
+        self.session.start()
+
+    def shutdown(self):
+        self.is_running = False
+        self.continuous = False
+        self.session.stop()
+        self.audio.close()
+
+    def _send_audio(self, ws, chunks: List, first: bool):
+        """把一个或多个音频块编码为一帧发送 (第一帧附带 common/business 参数)"""
+        status = self.STATUS_FIRST_FRAME if first else self.STATUS_CONTINUE_FRAME
+        ws.send(self.encoder.frame(status, chunks), websocket.ABNF.OPCODE_TEXT)
+        self.audio_stats["chunks_uploaded"] += len(chunks)
+        self.audio_stats["frames_sent"] += 1
+
+    def _send_last_frame(self, ws):
+        self._speech_end_time = self.endpointer.speech_end_time or time.monotonic()
+        ws.send(self.encoder.frame(self.STATUS_LAST_FRAME), websocket.ABNF.OPCODE_TEXT)
+        self.audio_stats["utterances"] += 1
+
+    def _drain_backlog(self, chunks: List) -> bool:
+        """发送变慢导致音频积压时，把积压的块一起读出、合并成一帧，返回说话是否已结束"""
+        ended = self.endpointer.ended
+        while not ended and len(chunks) < self.encoder.max_coalesce and self.audio.backlog() > 0:
+            buf = self.audio.read()
+            self.audio_stats["chunks_captured"] += 1
+            ended = self.endpointer.update(buf)
+            chunks.append(buf)
+        return ended
+
+    def _stream_utterance(self, ws):
+        """采集一句话的音频并逐帧发送，本地端点检测到说话结束后立即发送最后一帧"""
+        status = self.STATUS_FIRST_FRAME
+        RATE = self.audio.rate
+        CHUNK = self.audio.chunk
+
+        self.audio.flush()
+        self.endpointer.reset()
+        self._final_result.clear()
+        print("🔊 开始录音...")
+        # 最长录音 max_utterance_s 秒，通常在说话结束后 hangover 时间内就会提前结束
+        for i in range(0, int(RATE/CHUNK*self.max_utterance_s)):
+            if not self.is_running:
+                break
                 
-                # 10秒录音循环
-                for i in range(0, int(RATE/CHUNK*10)):
-                    if not self.is_running:
-                        break
-                        
-                    buf = stream.read(CHUNK, exception_on_overflow=False)
-                    
-                    if status == self.STATUS_FIRST_FRAME:
-                        d = {
-                            "common": self.ws_param.CommonArgs,
-                            "business": self.ws_param.BusinessArgs,
-                            "data": {
-                                "status": 0,
-                                "format": "audio/L16;rate=16000",
-                                "audio": str(base64.b64encode(buf), 'utf-8'),
-                                "encoding": "raw"
-                            }
-                        }
-                        ws.send(json.dumps(d))
-                        status = self.STATUS_CONTINUE_FRAME
-                        
-                    elif status == self.STATUS_CONTINUE_FRAME:
-                        d = {
-                            "data": {
-                                "status": 1,
-                                "format": "audio/L16;rate=16000",
-                                "audio": str(base64.b64encode(buf), 'utf-8'),
-                                "encoding": "raw"
-                            }
-                        }
-                        ws.send(json.dumps(d))
-                        
-                # 最后一帧
-                if self.is_running:
-                    d = {
-                        "data": {
-                            "status": 2,
-                            "format": "audio/L16;rate=16000",
-                            "audio": str(base64.b64encode(buf), 'utf-8'),
-                            "encoding": "raw"
-                        }
-                    }
-                    ws.send(json.dumps(d))
-                    time.sleep(1) # 等待结果返回
-            
-            except Exception as e:
-                print(f"🚨 录音或WebSocket发送出错: {e}")
-            finally:
-                if stream:
-                    stream.stop_stream()
-                    stream.close()
-                if p:
-                    p.terminate()
-                self.is_listening = False
-                print("🎙️ 录音结束，等待识别结果...")
+            chunks = [self.audio.read()]
+            self.audio_stats["chunks_captured"] += 1
+            self.endpointer.update(chunks[0])
+            ended = self._drain_backlog(chunks)
+            self._send_audio(ws, chunks, first=(status == self.STATUS_FIRST_FRAME))
+            status = self.STATUS_CONTINUE_FRAME
+
+            if ended:
+                print("🤫 检测到说话结束")
+                break
                 
-        thread.start_new_thread(run, ())
+        # 最后一帧
+        if self.is_running:
+            self._send_last_frame(ws)
+            # 等待最终识别结果，而不是固定等待
+            if not self._final_result.wait(timeout=self.result_timeout):
+                print("⚠️ 等待最终识别结果超时")
+
+    def _continuous_loop(self):
+        """免按键连续监听：麦克风常开，只有本地 VAD 判定为语音的片段才会上传。
+
+        每检测到一句话就开启一次独立的 IAT 会话；语音起点之前保留 pre_roll_ms
+        的音频一并发送，避免吞掉首字。静音段只在本地做检测，从不上传。
+        """
+        chunk_ms = 1000.0 * self.audio.chunk / self.audio.rate
+        pre_roll = deque(maxlen=max(1, int(self.pre_roll_ms / chunk_ms)))
+        max_chunks = int(self.max_utterance_s * 1000 / chunk_ms)
+        max_wake_chunks = int(self.max_wake_s * 1000 / chunk_ms)
+        ws = None
+        wake_segment = None
+        sent = 0
+        self.audio.flush()
+        self.endpointer.reset()
+        print("👂 连续监听已开启，直接说出指令即可")
+        try:
+            while self.is_running and self.continuous:
+                try:
+                    buf = self.audio.read()
+                except Exception as e:
+                    print(f"🚨 读取音频数据出错: {e}")
+                    break
+                self.audio_stats["chunks_captured"] += 1
+                ended = self.endpointer.update(buf)
+
+                if wake_segment is not None:
+                    # 未唤醒时的语音段只在本地做唤醒词检测，从不上传
+                    wake_segment.append(bytes(buf))
+                    if ended or len(wake_segment) >= max_wake_chunks:
+                        if self.wake_word.detect(np.frombuffer(b"".join(wake_segment), dtype=np.int16)):
+                            print("🔔 已唤醒，请说出指令")
+                            self._awake_until = time.monotonic() + self.wake_timeout_s
+                        wake_segment = None
+                        self.endpointer.reset()
+                    continue
+
+                if ws is None:
+                    pre_roll.append(buf)
+                    if not self.endpointer.in_speech:
+                        continue
+                    if self.wake_word is not None and time.monotonic() > self._awake_until:
+                        wake_segment = [bytes(b) for b in pre_roll]
+                        pre_roll.clear()
+                        continue
+                    # 检测到语音起点：取备用连接，先补发预录音频
+                    try:
+                        ws = self.session.acquire()
+                    except Exception as e:
+                        print(f"🚨 语音识别连接失败: {e}")
+                        pre_roll.clear()
+                        self.endpointer.reset()
+                        continue
+                    self._final_result.clear()
+                    self.is_listening = True
+                    threading.Thread(target=self._receive, args=(ws,), daemon=True).start()
+                    frames = list(pre_roll)
+                    pre_roll.clear()
+                    step = self.encoder.max_coalesce
+                    try:
+                        for i in range(0, len(frames), step):
+                            self._send_audio(ws, frames[i:i + step], first=(i == 0))
+                    except Exception as e:
+                        ws = self._abort_utterance(ws, e)
+                        continue
+                    sent = len(frames)
+                else:
+                    chunks = [buf]
+                    ended = self._drain_backlog(chunks)
+                    try:
+                        self._send_audio(ws, chunks, first=False)
+                    except Exception as e:
+                        ws = self._abort_utterance(ws, e)
+                        continue
+                    sent += len(chunks)
+
+                if ended or sent >= max_chunks:
+                    try:
+                        self._send_last_frame(ws)
+                    except Exception as e:
+                        print(f"🚨 WebSocket发送出错: {e}")
+                    # 结果由接收线程处理并关闭连接，采集循环立即回到监听状态
+                    ws = None
+                    self._awake_until = 0.0  # 每次唤醒只接受一句指令
+                    self.is_listening = False
+                    self.endpointer.reset()
+        finally:
+            # 线程因任何原因退出都要复位状态，否则 start / listen 会一直认为仍在运行
+            self.is_listening = False
+            self.continuous = False
+            self.session.set_active(False)
+            if ws is not None:
+                ws.close()
+            print("🔇 连续监听已关闭")
+
+    def _abort_utterance(self, ws, error):
+        """发送音频失败 (例如服务端中途断开)：放弃本句，回到监听状态"""
+        print(f"🚨 WebSocket发送出错，放弃本句: {error}")
+        try:
+            ws.close()
+        except Exception:
+            pass
+        self.is_listening = False
+        self.endpointer.reset()
+        return None
+
+    def start_continuous(self):
+        if self.continuous:
+            return
+        # 与单句识别互斥：两者共用环形缓冲区 (单生产者/单消费者) 和 Endpointer
+        if self.is_listening:
+            print("⚠️ 单句语音识别正在进行，请结束后再开启连续监听。")
+            return
+        try:
+            self.audio.open()
+        except Exception as e:
+            print(f"🚨 麦克风打开失败: {e}")
+            return
+        self.continuous = True
+        self.session.set_active(True)
+        self._continuous_thread = threading.Thread(target=self._continuous_loop, name="asr-continuous", daemon=True)
+        self._continuous_thread.start()
+
+    def stop_continuous(self):
+        self.continuous = False
+        self.session.set_active(False)
+
+    def _receive(self, ws):
+        """读取识别结果直到连接关闭"""
+        try:
+            while True:
+                message = ws.recv()
+                if not message:
+                    break
+                self.on_message(ws, message)
+        except websocket.WebSocketConnectionClosedException:
+            pass
+        except Exception as e:
+            self.on_error(ws, e)
+        ws.close()
+        self.on_close(ws)
+
+    def _run_utterance(self):
+        ws = None
+        try:
+            self.audio.open()
+            ws = self.session.acquire()
+            threading.Thread(target=self._receive, args=(ws,), daemon=True).start()
+            self._stream_utterance(ws)
+        except Exception as e:
+            print(f"🚨 录音或WebSocket发送出错: {e}")
+        finally:
+            if ws is not None:
+                ws.close()
+            self.is_listening = False
+            print("🎙️ 录音结束")
 
     def on_message(self, ws, message):
         """收到语音识别结果的处理 - 意图识别的核心入口"""
@@ -352,42 +2762,51 @@ class ASRClient:
             
             if code != 0:
                 print(f"🚨 讯飞 API 错误: {data_json.get('message', '未知错误')}")
+                self._final_result.set()
             else:
                 ws_data = data_json["data"]["result"]["ws"]
                 final_text = "".join([w["w"] for i in ws_data for w in i["cw"]])
                 
                 if final_text and final_text not in ['。', '.。', ' .。', ' 。']:
                     print(f"\n🗣️ 识别结果: {final_text}")
-                    # --- 核心：将 ASR 结果传递给 LangChain Agent ---
+                    # --- 核心：将 ASR 结果提交到指令流水线 (只入队，不阻塞 WebSocket 线程) ---
                     self.run_agent_func(final_text)
+
+                if data_json["data"].get("status") == 2:
+                    if self._speech_end_time is not None:
+                        self.final_latencies.append(time.monotonic() - self._speech_end_time)
+                        print(f"⏱️ 说话结束 -> 最终结果: {self.final_latencies[-1] * 1000:.0f}ms")
+                    self._final_result.set()
                     
         except Exception as e:
             print(f"🚨 解析语音识别结果时出错: {e}")
 
     def on_error(self, ws, error):
         print(f"🚨 WebSocket错误: {error}")
+        self._final_result.set()
 
     def on_close(self, ws, close_status_code=None, close_msg=None):
         print("🔌 语音识别连接已关闭")
-        self.is_listening = False
+        self._final_result.set()
+
+    def latency_report(self) -> Dict[str, Any]:
+        """说话结束到最终识别结果的延迟统计，单位秒"""
+        ordered = sorted(self.final_latencies)
+        return {
+            "count": len(ordered),
+            "median": ordered[len(ordered) // 2] if ordered else None,
+        }
         
     def start_voice_recognition_thread(self):
-        """在独立线程中启动 WebSocket"""
+        """在独立线程中采集并识别一句话，复用常驻麦克风和备用连接"""
         if self.is_listening:
             print("⚠️ 语音识别已在运行中。")
             return
-            
-        print("🌐 正在连接讯飞语音识别服务...")
-        wsUrl = self.ws_param.create_url()
-        ws = websocket.WebSocketApp(
-            wsUrl,
-            on_message=self.on_message,
-            on_error=self.on_error,
-            on_close=self.on_close
-        )
-        ws.on_open = self.on_open
-        # 使用单独的线程运行，不阻塞主程序
-        threading.Thread(target=ws.run_forever, daemon=True, kwargs={"sslopt": {"cert_reqs": ssl.CERT_NONE}, "ping_timeout": 2}).start()
+        if self._continuous_thread is not None and self._continuous_thread.is_alive():
+            print("⚠️ 连续监听已开启，请先输入 'listen' 关闭后再使用 'start'。")
+            return
+        self.is_listening = True
+        threading.Thread(target=self._run_utterance, daemon=True).start()
 
 # =======================================================
 # ========== 主程序与命令行界面 ==========
@@ -398,22 +2817,32 @@ def main():
     
     # 初始化 LLM (请替换为您的真实密钥)
     try:
-        llm = ChatOpenAI(
-            model="deepseek-chat",
-            openai_api_key="",
-            openai_api_base="https://api.deepseek.com",
-            temperature=0
-        )
+        llm = create_llm(api_key="")
         print("✅ LangChain LLM 初始化成功。")
     except Exception as e:
         print(f"❌ LangChain LLM 初始化失败，请检查密钥或网络: {e}")
         return
 
     # 设置 Agent
-    run_agent_function = setup_langchain_agent(llm, ALL_ARM_TOOLS, RAG_RETRIEVER)
+    plan_cache = PlanCache(
+        max_size=128,
+        ttl=24 * 3600,
+        fingerprint_fn=lambda: plan_fingerprint(ALL_ARM_TOOLS, ARM_DEVICE),
+        snapshot_path="plan_cache.json",
+    )
+    run_agent_function = setup_langchain_agent(llm, ALL_ARM_TOOLS, RAG_RETRIEVER, INTENT_MATCHER, plan_cache,
+                                               PINYIN_CORRECTOR)
+    run_agent_function.warmup()
+
+    # 指令流水线：识别结果和文本指令都只入队，解析与执行在各自的工作线程中进行
+    pipeline = CommandPipeline(run_agent_function, MOTION_EXECUTOR)
+    pipeline.start()
     
-    # 初始化 ASR 客户端 (包含 LangChain Agent 的调用逻辑)
-    asr_client = ASRClient(run_agent_function)
+    # 初始化 ASR 客户端 (识别结果提交到指令流水线)
+    # 可选的本地唤醒词 (wake_templates/ 目录下的唤醒词录音)
+    wake_word = WakeWordDetector.from_dir("wake_templates") if os.path.isdir("wake_templates") else None
+    asr_client = ASRClient(pipeline.submit, wake_word=wake_word)
+    asr_client.prepare()
     
     print("\n" + "="*50)
     print("=== LangChain Agent + RAG + 语音控制系统启动 ===")
@@ -422,31 +2851,54 @@ def main():
     # 命令行界面循环
     while asr_client.is_running:
         try:
-            cmd = input("\n请输入命令 ('start' 语音识别, 'quit' 退出): ").strip()
+            cmd = input("\n请输入命令 ('start' 语音识别, 'listen' 连续监听开/关, 'stop' 急停, 'quit' 退出): ").strip()
             
             if cmd == 'quit':
                 print("正在关闭系统...")
-                asr_client.is_running = False
+                asr_client.shutdown()
+                pipeline.stop()
+                MOTION_EXECUTOR.wait_idle(timeout=10)
                 break
             
             elif cmd == 'start':
                 asr_client.start_voice_recognition_thread()
+
+            elif cmd == 'listen':
+                if asr_client.continuous:
+                    asr_client.stop_continuous()
+                else:
+                    asr_client.start_continuous()
             
             elif cmd == 'test':
                 print("执行测试动作: 分拣黄色")
-                run_agent_function("请帮我分拣黄色的物品")
+                pipeline.submit("请帮我分拣黄色的物品")
             
             elif cmd == 'reset':
                 print("重置机械臂位置...")
-                action_init()
+                reset_arm()
+
+            elif cmd == 'stats':
+                report = run_agent_function.latency_report()
+                print(f"Agent 调用次数: {report['count']}, 首条延迟: {report['first']}, 稳态中位延迟: {report['steady_median']}")
+                print(f"计划缓存: {plan_cache.stats()}")
+                print(f"指令流水线: {pipeline.stats()}")
+                print(f"运动执行器: {MOTION_EXECUTOR.stats()}")
+                print(f"舵机状态缓存: {ARM_DEVICE.cache.stats()}")
+                print(f"拼音纠错: {PINYIN_CORRECTOR.stats}")
+                print(f"语音识别延迟 (说话结束 -> 最终结果): {asr_client.latency_report()}")
+                audio_stats = asr_client.audio_stats
+                upload_ratio = audio_stats["chunks_uploaded"] / max(1, audio_stats["chunks_captured"])
+                print(f"音频上传: {audio_stats}, 上传比例: {upload_ratio:.1%}")
+                print(f"音频缓冲区: {asr_client.audio.ring.stats()}")
                 
             elif cmd:
-                # 文本指令直接进入 Agent 流程
-                run_agent_function(cmd)
+                # 文本指令与语音指令一样进入指令流水线
+                pipeline.submit(cmd)
                 
         except KeyboardInterrupt:
             print("\n用户中断，系统退出。")
-            asr_client.is_running = False
+            asr_client.shutdown()
+            pipeline.stop()
             break
         except Exception as e:
             print(f"命令处理错误: {e}")
@@ -0,0 +1,51 @@
+# coding=utf-8
+"""
+动作索引冷启动测试
+对比每次启动重新向量化全部动作文档 (构建) 与内存映射已持久化的索引 (加载)，
+测量从启动到第一次检索返回的耗时。除实际动作外，另按 "每个料位数百个位置"
+合成更大的动作目录；达到 ANN_MIN_DOCUMENTS 的目录使用 IVF 索引，加载时不应重新聚类，
+且加载后的检索结果必须与构建时一致。
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain_core.documents import Document
+
+from auto import HashingEmbeddings, action_index_kind, build_action_index, load_action_index, rag_documents
+
+SIZES = [len(rag_documents), 1000, 10000, 100000]
+QUERY = "把黄色方块放到黄色区域"
+
+
+def synthetic_documents(n):
+    docs = list(rag_documents)
+    for i in range(n - len(docs)):
+        name = f"放置位置{i}"
+        docs.append(Document(page_content=f"{name}: 移动到第 {i // 100} 排第 {i % 100} 个料位并松开夹爪",
+                             metadata={"action_name": name, "tool_name": "action_sort_batch"}))
+    return docs[:n]
+
+
+def cold_start(path, docs, loader):
+    """新建向量化器 (无缓存) 后加载索引并完成第一次检索"""
+    t0 = time.perf_counter()
+    retriever = loader(path, docs, HashingEmbeddings())
+    result = retriever.search(QUERY, k=3)
+    return (time.perf_counter() - t0) * 1000, result
+
+
+if __name__ == '__main__':
+    for n in SIZES:
+        docs = synthetic_documents(n)
+        with tempfile.TemporaryDirectory() as path:
+            built, expected = cold_start(path, docs, build_action_index)
+            loaded, result = cold_start(path, docs, load_action_index)
+            size_kb = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)) / 1024
+        print(f"{n:>6} 个动作 ({action_index_kind(docs)}): 重新构建 {built:8.1f}ms -> 内存映射加载 {loaded:6.1f}ms "
+              f"(索引文件 {size_kb:.0f}KB)")
+        assert result == expected
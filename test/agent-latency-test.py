@@ -0,0 +1,47 @@
+# coding=utf-8
+"""
+Agent 延迟对比测试
+对比 "每次新建 ChatOpenAI + AgentExecutor" (旧方式) 与常驻 AgentRuntime + 连接池 (新方式)
+的首条指令延迟和稳态延迟。需要填入真实的 DeepSeek API Key。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from langchain_community.chat_models import ChatOpenAI
+from auto import ALL_ARM_TOOLS, RAG_RETRIEVER, AgentRuntime, create_llm
+
+API_KEY = ""
+COMMANDS = ["请帮我分拣黄色的物品", "把机械臂移动到待机的地方", "先抓起来再松开"] * 3
+
+
+def legacy_run(text):
+    """旧方式：每条指令都新建 LLM 客户端和 AgentExecutor"""
+    llm = ChatOpenAI(model="deepseek-chat", openai_api_key=API_KEY,
+                     openai_api_base="https://api.deepseek.com", temperature=0)
+    AgentRuntime(llm, ALL_ARM_TOOLS, RAG_RETRIEVER).run(text)
+
+
+def measure(run):
+    latencies = []
+    for text in COMMANDS:
+        t0 = time.perf_counter()
+        run(text)
+        latencies.append(time.perf_counter() - t0)
+    steady = sorted(latencies[1:])
+    return latencies[0], steady[len(steady) // 2]
+
+
+if __name__ == '__main__':
+    first, steady = measure(legacy_run)
+    print(f"[旧方式] 首条指令: {first:.2f}s, 稳态中位: {steady:.2f}s")
+
+    t0 = time.perf_counter()
+    runtime = AgentRuntime(create_llm(API_KEY), ALL_ARM_TOOLS, RAG_RETRIEVER)
+    runtime.warmup()
+    print(f"[新方式] 构建 + 预热耗时: {time.perf_counter() - t0:.2f}s (启动阶段完成)")
+    first, steady = measure(runtime.run)
+    print(f"[新方式] 首条指令: {first:.2f}s, 稳态中位: {steady:.2f}s")
@@ -0,0 +1,60 @@
+# coding=utf-8
+"""
+单次位姿切换耗时测试
+对比逐个舵机写入 (原 arm_move: 5 条命令、每条间隔 0.01s、舵机 5 前额外 0.1s)
+与 Arm_serial_servo_write6 一帧同步写入的命令下发耗时 (不含舵机运动本身的 s_time)。
+默认使用模拟器 (按 WRITE_LATENCY 模拟每条串口命令的总线耗时)，
+加 --hardware 参数则在真实 Arm_Lib 设备上测试。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+WRITE_LATENCY = 0.005  # 模拟器中每条串口命令的耗时 (秒)
+POSES = [[90, 80, 50, 50, 270], [90, 53, 33, 36, 270], [65, 22, 64, 56, 270], [117, 19, 66, 56, 270]]
+REPEAT = 5
+
+
+def per_servo_move(arm, position, s_time):
+    """原来的逐舵机写入方式"""
+    for i in range(5):
+        servo_id = i + 1
+        if servo_id == 5:
+            time.sleep(0.1)
+            arm.Arm_serial_servo_write(servo_id, position[i], int(s_time * 1.2))
+        else:
+            arm.Arm_serial_servo_write(servo_id, position[i], s_time)
+        time.sleep(0.01)
+
+
+def batched_move(arm, position, s_time):
+    arm.Arm_serial_servo_write6(*position, 60, s_time)
+
+
+def measure(arm, move):
+    total = 0.0
+    for _ in range(REPEAT):
+        for pose in POSES:
+            t0 = time.perf_counter()
+            move(arm, pose, 1000)
+            total += time.perf_counter() - t0
+            if "--hardware" in sys.argv:
+                time.sleep(1.2)  # 等待真实舵机运动完成
+    return total / (REPEAT * len(POSES))
+
+
+if __name__ == '__main__':
+    if "--hardware" in sys.argv:
+        from Arm_Lib import Arm_Device
+        arm = Arm_Device()
+    else:
+        from auto import ArmDeviceSimulator
+        arm = ArmDeviceSimulator(write_latency=WRITE_LATENCY)
+
+    legacy = measure(arm, per_servo_move)
+    batched = measure(arm, batched_move)
+    print(f"逐舵机写入: {legacy * 1000:.1f}ms / 次位姿切换")
+    print(f"同步写入:   {batched * 1000:.1f}ms / 次位姿切换")
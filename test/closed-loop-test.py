@@ -0,0 +1,86 @@
+# coding=utf-8
+"""
+闭环到位检测测试 (模拟器)
+对比固定时长等待 (移动后等 s_time、夹爪动作后等 500ms) 与 CompletionDetector
+回读闭环等待的分拣周期时间和夹爪停留时间。模拟器中夹爪合拢到 GRIP_CONTACT
+度时碰到物体。同时检查每次夹爪动作下发时关节是否已经到位 (不允许提前结束运动)，
+以及舵机有 DEAD_MS 起动死区时，arm_move 是否仍等到关节真正到位才返回。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import ArmDeviceSimulator, CompletionDetector, MotionCompiler, execute_trajectory, sort_waypoints
+
+CYCLES = 400
+GRIP_CONTACT = 100   # 夹爪碰到物体的角度
+READ_MS = 1.0        # 每次回读的总线耗时
+DEAD_MS = 80         # 命令下发到舵机开始转动的死区时间
+COLORS = ["放置黄色", "放置红色", "放置绿色", "放置蓝色"]
+
+
+class InstrumentedArm(ArmDeviceSimulator):
+    """记录夹爪停留时间，以及夹爪动作下发时关节离目标的最大偏差"""
+    def __init__(self, **kwargs):
+        self.grip_dwell = []
+        self.max_joint_error = 0.0
+        self._grip_at = None
+        super().__init__(verbose=False, grip_contact=GRIP_CONTACT, read_ms=READ_MS, **kwargs)
+
+    def _before_write(self, gripper):
+        if self._grip_at is not None:
+            self.grip_dwell.append(self.now_ms - self._grip_at)
+            self._grip_at = None
+        if gripper:
+            error = max(abs(a - b) for a, b in zip(self.current_angles()[:5], self.servo_angles[:5]))
+            self.max_joint_error = max(self.max_joint_error, error)
+            self._grip_at = self.now_ms
+
+    def Arm_serial_servo_write(self, servo_id, angle, s_time):
+        self._before_write(servo_id == 6)
+        super().Arm_serial_servo_write(servo_id, angle, s_time)
+
+    def Arm_serial_servo_write6(self, s1, s2, s3, s4, s5, s6, s_time):
+        self._before_write(False)
+        super().Arm_serial_servo_write6(s1, s2, s3, s4, s5, s6, s_time)
+
+
+def run(closed_loop):
+    arm = InstrumentedArm()
+    if closed_loop:
+        arm.detector = CompletionDetector(arm)
+    compiler = MotionCompiler(duration_fn=arm.move_duration)
+    arm.grip_dwell.clear()
+    arm.max_joint_error = 0.0
+    start = arm.now_ms
+    for i in range(CYCLES):
+        execute_trajectory(arm, compiler.compile(sort_waypoints(arm.positions[COLORS[i % 4]], arm), arm.servo_angles))
+    return arm, (arm.now_ms - start) / CYCLES
+
+
+def dead_time_move():
+    arm = ArmDeviceSimulator(verbose=False, read_ms=READ_MS, dead_ms=DEAD_MS)
+    arm.detector = CompletionDetector(arm)
+    target = arm.positions["准备位置"]
+    start = arm.now_ms
+    arm.arm_move(target, 1000)
+    reached = arm.current_angles()[:5]
+    error = max(abs(a - b) for a, b in zip(reached, target))
+    cache_ok = all(abs(a - b) <= 1 for a, b in zip(arm.cache.angles[:5], target))
+    print(f"起动死区 {DEAD_MS}ms: arm_move 耗时 {arm.now_ms - start:.0f}ms, 返回时关节 {reached}, "
+          f"最大偏差 {error:.1f}°, 缓存{'一致' if cache_ok else '记录了中途角度'}")
+    return error
+
+
+if __name__ == '__main__':
+    for name, closed_loop in (("固定等待", False), ("回读闭环", True)):
+        arm, cycle = run(closed_loop)
+        dwell = sum(arm.grip_dwell) / len(arm.grip_dwell)
+        print(f"{name}: 平均周期 {cycle:.0f}ms, 夹爪平均停留 {dwell:.0f}ms, "
+              f"夹爪动作时关节最大偏差 {arm.max_joint_error:.1f}°")
+        if arm.detector is not None:
+            print(f"  检测统计: {arm.detector.counters}")
+    error = dead_time_move()
+    print("✅ 通过" if error <= 3 else "❌ 关节未到位就返回")
@@ -0,0 +1,87 @@
+# coding=utf-8
+"""
+音频帧编码微基准
+对比原来的 "dict + base64 + str + json.dumps" 写法与 FrameEncoder 的每帧 CPU 耗时
+和每帧临时内存分配 (tracemalloc 峰值)，并检查 FrameEncoder 的输出经 json.loads
+解析后与旧写法构建的 dict 完全一致 (status 0/1/2、合并多块、空音频)。
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import FrameEncoder, Ws_Param
+
+CHUNK_BYTES = 1040  # 520 个 16bit 采样
+N = 20000
+
+ws_param = Ws_Param('45099785', '', '')
+encoder = FrameEncoder(ws_param.CommonArgs, ws_param.BusinessArgs)
+buf = os.urandom(CHUNK_BYTES)
+
+
+def legacy_dict(status, buf):
+    d = {
+        "data": {
+            "status": status,
+            "format": "audio/L16;rate=16000",
+            "audio": str(base64.b64encode(buf), 'utf-8'),
+            "encoding": "raw"
+        }
+    }
+    if status == 0:
+        d = {"common": ws_param.CommonArgs, "business": ws_param.BusinessArgs, **d}
+    return d
+
+
+def legacy_frame(buf):
+    return json.dumps(legacy_dict(1, buf))
+
+
+def check_equivalence():
+    """编码器输出与旧 dict 逐项比较；块以 memoryview 传入，长度覆盖 base64 的三种补齐情况"""
+    cases = 0
+    for status in (0, 1, 2):
+        for sizes in ([CHUNK_BYTES], [CHUNK_BYTES] * 4, [CHUNK_BYTES, 1000, 1001], [], [0]):
+            chunks = [memoryview(os.urandom(size)) for size in sizes]
+            expected = legacy_dict(status, b"".join(chunks))
+            got = json.loads(bytes(encoder.frame(status, chunks)))
+            assert got == expected, (status, sizes)
+            cases += 1
+    print(f"json.loads 与旧写法一致: {cases} 组")
+
+
+def encoder_frame(buf):
+    return encoder.frame(1, [buf])
+
+
+def encoder_coalesced(buf):
+    return encoder.frame(1, [buf, buf, buf, buf])
+
+
+def measure(name, fn, chunks_per_frame=1):
+    t0 = time.process_time()
+    for _ in range(N):
+        fn(buf)
+    cpu_us = (time.process_time() - t0) / N * 1e6
+
+    fn(buf)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    fn(buf)
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    print(f"{name:<16} 每帧 {cpu_us:6.2f}µs, 每块 {cpu_us / chunks_per_frame:6.2f}µs, 每帧临时分配 {peak}B")
+
+
+if __name__ == '__main__':
+    check_equivalence()
+    measure("旧写法", legacy_frame)
+    measure("FrameEncoder", encoder_frame)
+    measure("合并 4 块", encoder_coalesced, chunks_per_frame=4)
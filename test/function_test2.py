@@ -59,6 +59,15 @@ class VoiceControlledArm:
             "放置蓝色": [44, 66, 20, 28, 270],
         }
         
+        # 6 个舵机最后一次写入的角度 (舵机 6 为夹爪)
+        self.servo_angles = [90, 90, 90, 90, 90, 60]
+
+        # 回读闭环到位检测参数
+        self.poll_interval = 0.02   # 回读间隔 (秒)
+        self.arrive_tolerance = 3   # 到位容差 (度)
+        self.stall_time = 0.06      # 夹爪角度持续不变多久判定为堵转 (秒)
+        self.start_grace = 0.2      # 下发后多久还没转动才开始判断堵转 (秒)，覆盖命令到起动的死区
+        
         # 初始化机械臂位置
         self.init_arm()
 
@@ -72,30 +81,71 @@ class VoiceControlledArm:
     def arm_clamp_block(self, enable):
         """控制夹爪，enable=1：夹住，=0：松开"""
         if enable == 0:
-            self.arm.Arm_serial_servo_write(6, 60, 400)
+            self.arm_write_servo(6, 60, 400)
             print("松开夹爪")
         else:
-            self.arm.Arm_serial_servo_write(6, 130, 400)
+            self.arm_write_servo(6, 130, 400)
             print("夹紧夹爪")
-        time.sleep(0.5)
+        # 夹住物体时夹爪会堵转在物体处，堵转即视为夹紧
+        self.wait_arrival({6: self.servo_angles[5]}, 400)
+
+    def wait_arrival(self, targets, s_time):
+        """轮询回读舵机角度，直到全部到位 (容差内)、夹爪堵转 (夹住物体) 或超时，返回对应状态。
+        关节 (舵机 1-5) 不转不算到位，一直等到超时"""
+        started = time.monotonic()
+        deadline = started + s_time / 1000 * 1.5 + 0.2
+        first = {}
+        moved = set()
+        anchor = {}
+        still_since = {}
+        while True:
+            pending = []
+            for servo_id, target in targets.items():
+                angle = self.arm.Arm_serial_servo_read(servo_id)
+                if angle is None or abs(angle - target) > self.arrive_tolerance:
+                    pending.append(servo_id)
+                if angle is None:
+                    continue
+                first.setdefault(servo_id, angle)
+                if abs(angle - first[servo_id]) > 1:
+                    moved.add(servo_id)
+                if servo_id not in anchor or abs(angle - anchor[servo_id]) > 1:
+                    anchor[servo_id] = angle
+                    still_since[servo_id] = time.monotonic()
+            if not pending:
+                return "arrived"
+            now = time.monotonic()
+            # 只对夹爪判断堵转，且要等夹爪已开始转动或过了起动死区；
+            # 预计转动不明显 (静止窗口内应转过 3 度以下) 时靠超时兜底
+            if (pending == [6] and 6 in first
+                    and (6 in moved or now - started >= self.start_grace)
+                    and abs(targets[6] - first[6]) / s_time * self.stall_time * 1000 >= 3
+                    and now - still_since[6] >= self.stall_time):
+                return "stalled"
+            if now > deadline:
+                print(f"舵机 {pending} 等待到位超时")
+                return "timeout"
+            time.sleep(self.poll_interval)
+
+    def arm_write_servo(self, servo_id, angle, s_time):
+        """写单个舵机并记录角度；所有单舵机写入都要经过这里，否则 arm_move 会把它写回旧角度"""
+        self.arm.Arm_serial_servo_write(servo_id, angle, s_time)
+        self.servo_angles[servo_id - 1] = angle
+
+    def arm_write_all(self, angles, s_time):
+        """6 个舵机一帧同步写入，所有关节同时起动"""
+        self.arm.Arm_serial_servo_write6(*angles, s_time)
+        self.servo_angles = list(angles)
 
     def arm_move(self, position, s_time=500):
-        """移动机械臂到指定位置"""
-        for i in range(5):
-            servo_id = i + 1
-            if servo_id == 5:
-                time.sleep(0.1)
-                self.arm.Arm_serial_servo_write(servo_id, position[i], int(s_time * 1.2))
-            else:
-                self.arm.Arm_serial_servo_write(servo_id, position[i], s_time)
-            time.sleep(0.01)
-        time.sleep(s_time / 1000)
+        """移动机械臂到指定位置 (夹爪保持当前角度)"""
+        self.arm_write_all(list(position[:5]) + [self.servo_angles[5]], s_time)
+        self.wait_arrival({i + 1: position[i] for i in range(5)}, s_time)
 
     def arm_move_up(self):
-        """机械臂向上移动"""
-        self.arm.Arm_serial_servo_write(2, 90, 1500)
-        self.arm.Arm_serial_servo_write(3, 90, 1500)
-        self.arm.Arm_serial_servo_write(4, 90, 1500)
+        """机械臂向上移动 (只动关节 2-4)"""
+        for servo_id in (2, 3, 4):
+            self.arm_write_servo(servo_id, 90, 1500)
         time.sleep(0.1)
 
 class Ws_Param:
@@ -218,7 +268,7 @@ def execute_command(command):
             angle = command.get("angle", 90)
             move_time = command.get("time", 500)
             print(f"控制舵机 {servo_id} 到角度 {angle}")
-            voice_arm.arm.Arm_serial_servo_write(servo_id, angle, move_time)
+            voice_arm.arm_write_servo(servo_id, angle, move_time)
             
         elif action == "unknown":
             print(f"指令不清楚: {command.get('message', '请重新说明')}")
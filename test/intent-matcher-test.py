@@ -0,0 +1,45 @@
+# coding=utf-8
+"""
+本地意图匹配测试
+检查 IntentMatcher 对一组指令的派发结果：应直接派发的指令必须命中正确的工具，
+否定、疑问、带数量或有歧义的指令必须返回 None (交给 LLM 处理)。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import INTENT_MATCHER
+
+# (指令, 期望派发的工具; None 表示必须交给 LLM)
+CASES = [
+    ("初始化", "action_init"), ("复位", "action_init"), ("请复位一下", "action_init"),
+    ("准备", "action_ready"), ("待机吧", "action_ready"),
+    ("抓取", "action_grab"), ("帮我夹住", "action_grab"),
+    ("释放", "action_release"), ("松开夹爪", "action_release"), ("放开吧", "action_release"),
+    ("分拣黄色", "action_sort_yellow"), ("黄色分拣", "action_sort_yellow"),
+    # 否定
+    ("不释放", None), ("没释放", None), ("不抓取", None), ("甭抓取", None), ("勿抓取", None),
+    ("莫松开", None), ("不准放开", None), ("不许复位", None), ("不要抓取", None), ("别释放", None),
+    ("取消分拣黄色", None),
+    # 疑问
+    ("释放了吗", None), ("抓取吗", None), ("抓取?", None), ("准备好了呢", None),
+    # 数量 (由批量分拣处理)
+    ("黄色分拣三次", None), ("夹取两次", None), ("抓取2次", None),
+    # 歧义 / 剩余内容过多
+    ("抓取然后释放", None), ("先去准备位置再慢慢地抓取", None), ("今天天气怎么样", None),
+]
+
+
+if __name__ == '__main__':
+    failures = []
+    for text, expected in CASES:
+        tool = INTENT_MATCHER.match(text)
+        got = tool.name if tool is not None else None
+        if got != expected:
+            failures.append((text, expected, got))
+    for text, expected, got in failures:
+        print(f"❌ '{text}': 期望 {expected}, 实际 {got}")
+    print(f"{len(CASES) - len(failures)}/{len(CASES)} 通过")
+    assert not failures
@@ -0,0 +1,71 @@
+# coding=utf-8
+"""
+不相交舵机组并行执行测试 (模拟器)
+1. 空夹爪收起：先合拢夹爪再回初始位置 vs 合拢夹爪与关节运动合并为一段
+   (合拢不会丢下物体，张开夹爪不能这样并行)；
+2. 连续的工具调用：逐个执行 vs 在 MotionExecutor 中排队、合并编译执行。
+均按模拟器虚拟时钟计时。
+"""
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import ArmDeviceSimulator, MotionCompiler, MotionExecutor, execute_trajectory, grip, move_to
+
+
+def open_gripper_arm():
+    arm = ArmDeviceSimulator(verbose=False)
+    arm.arm_move(arm.positions["准备位置"])
+    arm.arm_clamp_block(0)
+    return arm
+
+
+def timed(arm, waypoints):
+    compiler = MotionCompiler(duration_fn=arm.move_duration)
+    start = arm.now_ms
+    execute_trajectory(arm, compiler.compile(waypoints, arm.servo_angles))
+    return arm.now_ms - start
+
+
+def sequential(waypoints):
+    """去掉 overlap 标记，所有航点按顺序执行"""
+    return [wp._replace(overlap=False) for wp in waypoints]
+
+
+def tool_sequence(coalesce):
+    arm = ArmDeviceSimulator(verbose=False)
+    executor = MotionExecutor(arm)
+    compiler = MotionCompiler(duration_fn=arm.move_duration)
+    jobs = [
+        [move_to(arm.positions["准备位置"])],
+        [move_to(arm.positions["抓取位置"]), grip(1)],
+        [grip(0), move_to(arm.positions["初始位置"])],
+        [move_to(arm.positions["准备位置"])],
+    ]
+    start = arm.now_ms
+    gate = threading.Event()
+    if coalesce:
+        executor.submit(gate.wait)  # 模拟执行线程正忙，后面的工具调用先排队
+    for waypoints in jobs:
+        executor.run_waypoints(waypoints, compiler)
+        if not coalesce:
+            executor.wait_idle()
+    gate.set()
+    executor.wait_idle()
+    return arm.now_ms - start, executor.counters["coalesced"]
+
+
+if __name__ == '__main__':
+    arm = open_gripper_arm()
+    stow = [grip(1, overlap=True), move_to(arm.positions["初始位置"])]
+    before = timed(open_gripper_arm(), sequential(stow))
+    after = timed(open_gripper_arm(), stow)
+    print(f"空夹爪收起:       顺序 {before:.0f}ms -> 并行 {after:.0f}ms (节省 {before - after:.0f}ms)")
+
+    before, _ = tool_sequence(coalesce=False)
+    after, coalesced = tool_sequence(coalesce=True)
+    print(f"连续 4 个工具调用: 逐个 {before:.0f}ms -> 排队合并 {after:.0f}ms "
+          f"(节省 {before - after:.0f}ms, 合并 {coalesced} 个任务)")
@@ -0,0 +1,79 @@
+# coding=utf-8
+"""
+拼音纠错测试
+在一组讯飞识别风格的指令文本上 (含同音字/近音字误识别，也含无误识别的原句)，
+对比纠错前后:
+  - 本地快速通道 (IntentMatcher) 直接派发正确工具 / 派发错误工具 / 交给 LLM 的比例
+  - RAG 检索 top-1 的准确率
+并统计纠错把原本正确的文本改错的次数和单次纠错耗时。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import INTENT_MATCHER, PINYIN_CORRECTOR, RAG_RETRIEVER, lazy_pinyin, rag_documents
+
+# (识别文本, 正确的工具)
+CORPUS = [
+    # 同音字 / 近音字
+    ("初使化", "action_init"), ("出始化", "action_init"), ("复为", "action_init"), ("服位", "action_init"),
+    ("重至", "action_init"), ("回到出使位置", "action_init"),
+    ("准被", "action_ready"), ("尊备", "action_ready"), ("待急", "action_ready"), ("代机", "action_ready"),
+    ("抓起", "action_grab"), ("抓去", "action_grab"), ("加取", "action_grab"), ("夹住", "action_grab"),
+    ("夹紧", "action_grab"), ("甲取", "action_grab"),
+    ("送开", "action_release"), ("松凯", "action_release"), ("放凯", "action_release"), ("试放", "action_release"),
+    ("送开夹爪", "action_release"), ("释放物题", "action_release"),
+    ("向商", "action_move_up"), ("向上一动", "action_move_up"), ("太高", "action_move_up"), ("上生", "action_move_up"),
+    ("抬搞机械臂", "action_move_up"), ("升搞", "action_move_up"),
+    ("分捡黄色", "action_sort_yellow"), ("分拣皇色", "action_sort_yellow"), ("皇色分拣", "action_sort_yellow"),
+    ("黄色分检", "action_sort_yellow"), ("分拣慌色", "action_sort_yellow"),
+    ("批量分检", "action_sort_batch"), ("皮量分拣", "action_sort_batch"),
+    # 无误识别
+    ("初始化", "action_init"), ("复位", "action_init"), ("准备", "action_ready"), ("抓取", "action_grab"),
+    ("松开", "action_release"), ("释放物体", "action_release"), ("向上移动", "action_move_up"),
+    ("分拣黄色", "action_sort_yellow"), ("黄色分拣", "action_sort_yellow"), ("批量分拣", "action_sort_batch"),
+    ("帮我把机械臂复位一下", "action_init"), ("请抬高机械臂", "action_move_up"),
+    # 其它颜色的分拣指令：不能被改写成黄色 (只有批量分拣能分拣其它颜色)
+    ("分拣红色", "action_sort_batch"), ("红色分拣", "action_sort_batch"), ("请分拣红色", "action_sort_batch"),
+    ("分拣绿色", "action_sort_batch"), ("绿色分拣", "action_sort_batch"), ("分拣蓝色", "action_sort_batch"),
+    ("蓝色分拣", "action_sort_batch"), ("分捡红色", "action_sort_batch"), ("分拣宏色", "action_sort_batch"),
+]
+REPEAT = 200
+
+
+def evaluate(texts):
+    direct = wrong = top1 = 0
+    for text, (_, tool) in zip(texts, CORPUS):
+        matched = INTENT_MATCHER.match(text)
+        if matched is not None:
+            direct += matched.name == tool
+            wrong += matched.name != tool
+        top1 += RAG_RETRIEVER.invoke(text)[0].metadata["tool_name"] == tool
+    n = len(CORPUS)
+    return (f"快速通道正确 {direct}/{n} ({direct / n:.0%}), 派发错误 {wrong}, "
+            f"交给 LLM {n - direct - wrong}; RAG top-1 {top1 / n:.0%}")
+
+
+if __name__ == '__main__':
+    print(f"拼音来源: {'pypinyin' if lazy_pinyin is not None else '内置拼音表'}, 词条数: {len(rag_documents)} 个动作")
+    raw = [text for text, _ in CORPUS]
+    corrected = [PINYIN_CORRECTOR.correct(text) for text in raw]
+    for text, fixed in zip(raw, corrected):
+        if fixed != text:
+            print(f"  {text} -> {fixed}")
+
+    # 原本就与动作名/别名一致的文本，纠错后快速通道结果不能变差
+    broken = sum(INTENT_MATCHER.match(t) is not None and INTENT_MATCHER.match(f) is None
+                 for t, f in zip(raw, corrected))
+    print(f"\n纠错前: {evaluate(raw)}")
+    print(f"纠错后: {evaluate(corrected)}")
+    print(f"纠错导致快速通道失效: {broken} 条")
+
+    t0 = time.perf_counter()
+    for _ in range(REPEAT):
+        for text in raw:
+            PINYIN_CORRECTOR.correct(text)
+    print(f"单次纠错耗时: {(time.perf_counter() - t0) / (REPEAT * len(raw)) * 1e6:.0f}µs")
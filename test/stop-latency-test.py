@@ -0,0 +1,48 @@
+# coding=utf-8
+"""
+急停延迟测试 (模拟器，实时运动)
+机械臂排队执行多个分拣流程时，在随机时刻向指令流水线提交 "停"，
+测量从提交停止指令到下发保持命令的延迟 (目标 < 100ms)，
+并检查急停之后没有排队的动作继续执行。
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import ArmDeviceSimulator, CommandPipeline, MotionCompiler, MotionExecutor, sort_waypoints
+
+TRIALS = 20
+BUDGET_MS = 100.0
+COLORS = ["放置黄色", "放置红色", "放置绿色"]
+
+
+if __name__ == '__main__':
+    arm = ArmDeviceSimulator(time_scale=1.0)
+    compiler = MotionCompiler(duration_fn=arm.move_duration)
+    executor = MotionExecutor(arm)
+    pipeline = CommandPipeline(runtime=None, executor=executor)
+
+    latencies = []
+    leaked = 0
+    for _ in range(TRIALS):
+        for place in COLORS:
+            executor.run_waypoints(sort_waypoints(arm.positions[place], arm), compiler)
+        time.sleep(random.uniform(0.05, 1.5))
+        pipeline.submit("停下")
+        executor.wait_idle(timeout=1)
+        latencies.append(executor.stop_latencies[-1])
+        held = list(arm.servo_angles)
+        time.sleep(0.1)
+        leaked += arm.servo_angles != held
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"\n急停延迟 ({TRIALS} 次): 中位 {latencies[len(latencies) // 2]:.1f}ms, "
+          f"P95 {p95:.1f}ms, 最大 {latencies[-1]:.1f}ms")
+    print(f"急停后仍有动作执行: {leaked} 次")
+    print(f"执行器统计: {executor.stats()}")
+    print("✅ 通过" if latencies[-1] < BUDGET_MS and not leaked else f"❌ 超过 {BUDGET_MS:.0f}ms 预算或急停未生效")
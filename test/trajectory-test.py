@@ -0,0 +1,51 @@
+# coding=utf-8
+"""
+分拣周期时间测试 (模拟器)
+对比原来逐步阻塞执行的分拣流程与 MotionCompiler 编译后的轨迹，
+按模拟器虚拟时钟计算一个分拣周期的时长。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import ArmDeviceSimulator, MotionCompiler, execute_trajectory, sort_waypoints
+
+COLORS = ["放置黄色", "放置红色", "放置绿色", "放置蓝色"]
+
+
+def legacy_cycle(arm, place):
+    """原 action_sort_yellow 的执行方式：每一步固定时长、到位后再执行下一步"""
+    arm.arm_move(arm.positions["准备位置"], 1000)
+    arm.arm_move(arm.positions["抓取位置"], 1000)
+    arm.arm_clamp_block(1)
+    arm.arm_move_up(1500)
+    arm.arm_move(arm.positions[place], 1000)
+    arm.arm_clamp_block(0)
+    arm.arm_move_up(1500)
+
+
+def compiled_cycle(arm, place):
+    compiler = MotionCompiler(duration_fn=arm.move_duration)
+    segments = compiler.compile(sort_waypoints(arm.positions[place], arm), arm.servo_angles)
+    execute_trajectory(arm, segments)
+
+
+def measure(cycle):
+    arm = ArmDeviceSimulator()
+    results = {}
+    for place in COLORS:
+        start = arm.now_ms
+        cycle(arm, place)
+        results[place] = arm.now_ms - start
+    return results
+
+
+if __name__ == '__main__':
+    legacy = measure(legacy_cycle)
+    compiled = measure(compiled_cycle)
+    print("\n分拣周期 (模拟时间):")
+    for place in COLORS:
+        saved = 1 - compiled[place] / legacy[place]
+        print(f"  {place}: 原流程 {legacy[place]:.0f}ms -> 编译轨迹 {compiled[place]:.0f}ms (缩短 {saved:.0%})")
@@ -0,0 +1,52 @@
+# coding=utf-8
+"""
+唤醒词检测测试
+用法: python test/wakeword-test.py <模板目录> <唤醒词录音目录> <非唤醒词录音目录>
+录音均为 16kHz 16bit 单声道 WAV。输出每秒音频的 CPU 耗时、唤醒率和误唤醒率，
+以及各片段的 DTW 距离，便于校准 threshold。
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from auto import WakeWordDetector, load_wav
+
+
+def evaluate(detector, clip_dir):
+    accepted = 0
+    total = 0
+    audio_seconds = 0.0
+    cpu_seconds = 0.0
+    for name in sorted(os.listdir(clip_dir)):
+        if not name.lower().endswith(".wav"):
+            continue
+        pcm = load_wav(os.path.join(clip_dir, name))
+        t0 = time.process_time()
+        distance = detector.distance(pcm)
+        cpu_seconds += time.process_time() - t0
+        audio_seconds += pcm.size / detector.rate
+        total += 1
+        accepted += distance < detector.threshold
+        print(f"  {name}: 距离 {distance:.2f}")
+    return accepted, total, audio_seconds, cpu_seconds
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print(__doc__)
+        sys.exit(1)
+    template_dir, positive_dir, negative_dir = sys.argv[1:]
+    detector = WakeWordDetector.from_dir(template_dir)
+
+    print("唤醒词录音:")
+    hit, n_pos, pos_sec, pos_cpu = evaluate(detector, positive_dir)
+    print("非唤醒词录音:")
+    false_accept, n_neg, neg_sec, neg_cpu = evaluate(detector, negative_dir)
+
+    print(f"\n阈值: {detector.threshold}")
+    print(f"唤醒率: {hit}/{n_pos} = {hit / max(1, n_pos):.1%}")
+    print(f"误唤醒率: {false_accept}/{n_neg} = {false_accept / max(1, n_neg):.1%}")
+    print(f"CPU 耗时: {1000 * (pos_cpu + neg_cpu) / max(1e-9, pos_sec + neg_sec):.1f}ms / 每秒音频")